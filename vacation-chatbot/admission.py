@@ -0,0 +1,198 @@
+"""
+Admission Control Module
+Concurrency limiting and priority queueing for LLM-bound chat requests
+
+Requests acquire a slot before calling the Llama API. When all slots are busy
+they wait in a bounded priority queue (sessions that already have an
+itinerary go first) until a slot frees up or their deadline passes. When the
+queue is full, new requests are rejected immediately with a Retry-After hint.
+
+The concurrency limit adapts to the upstream (AIMD): it grows slowly while
+calls succeed within the target latency and is cut sharply on 429/503
+responses or slow calls.
+
+Configure with environment variables:
+    LLM_CONCURRENCY         = initial concurrent LLM calls (default: 8)
+    LLM_MIN_CONCURRENCY     = lower bound for the adaptive limit (default: 1)
+    LLM_MAX_CONCURRENCY     = upper bound for the adaptive limit (default: 32)
+    LLM_QUEUE_SIZE          = maximum waiting requests (default: 32)
+    LLM_QUEUE_TIMEOUT       = seconds a request may wait for a slot (default: 10)
+    LLM_TARGET_LATENCY      = upstream latency in seconds considered healthy (default: 8)
+"""
+
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+
+import metrics
+
+PRIORITY_EXISTING_ITINERARY = 0
+PRIORITY_NEW_CONVERSATION = 1
+
+# Status codes that mean the upstream wants us to back off
+BACKOFF_STATUSES = {429, 503}
+
+LIMIT_GAUGE = metrics.REGISTRY.gauge(
+    'ecotrip_llm_concurrency_limit', 'Current adaptive limit on concurrent LLM calls')
+ACTIVE_GAUGE = metrics.REGISTRY.gauge(
+    'ecotrip_llm_admitted_in_flight', 'Chat requests holding an LLM slot')
+QUEUE_GAUGE = metrics.REGISTRY.gauge(
+    'ecotrip_llm_queue_length', 'Chat requests waiting for an LLM slot')
+QUEUE_WAIT = metrics.REGISTRY.histogram(
+    'ecotrip_llm_queue_wait_seconds', 'Time spent waiting for an LLM slot', ('priority',))
+REJECTIONS = metrics.REGISTRY.counter(
+    'ecotrip_llm_rejections_total', 'Chat requests rejected by admission control', ('reason',))
+
+
+class Rejected(Exception):
+    """Raised when a request cannot be admitted; carries a Retry-After hint in seconds"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f"LLM capacity exhausted ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    def __init__(self, priority):
+        self.priority = priority
+        self.event = threading.Event()
+        self.admitted = False
+        self.evicted = False
+
+
+class Ticket:
+    """A held LLM slot; release it when the call is finished"""
+
+    def __init__(self, controller):
+        self._controller = controller
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._controller._release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class AdmissionController:
+    """Adaptive concurrency limit with a bounded priority wait queue"""
+
+    def __init__(self, limit=8, min_limit=1, max_limit=32, max_queue=32,
+                 queue_timeout=10.0, target_latency=8.0):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(limit, min_limit), max_limit))
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.target_latency = target_latency
+        self.active = 0
+        self._queue = []  # heap of (priority, seq, waiter)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._avg_latency = target_latency / 2
+        self._publish()
+
+    def acquire(self, priority=PRIORITY_NEW_CONVERSATION, timeout=None):
+        """Wait for a slot, returning a Ticket or raising Rejected"""
+        timeout = self.queue_timeout if timeout is None else timeout
+        start = time.perf_counter()
+        with self._lock:
+            if self.active < int(self.limit) and not self._queue:
+                self.active += 1
+                self._publish()
+                QUEUE_WAIT.observe(0.0, priority=priority)
+                return Ticket(self)
+
+            if len(self._queue) >= self.max_queue:
+                # A higher-priority request displaces the lowest-priority waiter
+                worst = max(self._queue)
+                if worst[0] <= priority:
+                    REJECTIONS.inc(reason='queue_full')
+                    raise Rejected('queue_full', self._retry_after_locked())
+                self._queue.remove(worst)
+                heapq.heapify(self._queue)
+                worst[2].evicted = True
+                worst[2].event.set()
+
+            waiter = _Waiter(priority)
+            heapq.heappush(self._queue, (priority, next(self._seq), waiter))
+            self._publish()
+
+        waiter.event.wait(timeout)
+
+        with self._lock:
+            if waiter.admitted:
+                QUEUE_WAIT.observe(time.perf_counter() - start, priority=priority)
+                return Ticket(self)
+            # Timed out or evicted: leave the queue if still in it
+            self._queue = [entry for entry in self._queue if entry[2] is not waiter]
+            heapq.heapify(self._queue)
+            self._publish()
+            reason = 'evicted' if waiter.evicted else 'timeout'
+            REJECTIONS.inc(reason=reason)
+            raise Rejected(reason, self._retry_after_locked())
+
+    def observe(self, latency, status_code=None):
+        """Feed back one upstream call's latency and status to adapt the limit"""
+        with self._lock:
+            self._avg_latency = 0.8 * self._avg_latency + 0.2 * latency
+            if status_code in BACKOFF_STATUSES:
+                self.limit = max(self.min_limit, self.limit * 0.7)
+            elif latency > self.target_latency:
+                self.limit = max(self.min_limit, self.limit * 0.9)
+            elif status_code is not None and status_code < 400:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._grant_locked()
+            self._publish()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'limit': round(self.limit, 2),
+                'active': self.active,
+                'queued': len(self._queue),
+                'avg_latency_s': round(self._avg_latency, 3)
+            }
+
+    def _release(self):
+        with self._lock:
+            self.active -= 1
+            self._grant_locked()
+            self._publish()
+
+    def _grant_locked(self):
+        while self._queue and self.active < int(self.limit):
+            _, _, waiter = heapq.heappop(self._queue)
+            waiter.admitted = True
+            self.active += 1
+            waiter.event.set()
+
+    def _retry_after_locked(self):
+        # Time for the current queue to drain through the available slots
+        slots = max(1, int(self.limit))
+        estimate = (len(self._queue) + 1) * self._avg_latency / slots
+        return int(min(60, max(1, math.ceil(estimate))))
+
+    def _publish(self):
+        LIMIT_GAUGE.set(round(self.limit, 2))
+        ACTIVE_GAUGE.set(self.active)
+        QUEUE_GAUGE.set(len(self._queue))
+
+
+LLM_ADMISSION = AdmissionController(
+    limit=int(os.getenv('LLM_CONCURRENCY', '8')),
+    min_limit=int(os.getenv('LLM_MIN_CONCURRENCY', '1')),
+    max_limit=int(os.getenv('LLM_MAX_CONCURRENCY', '32')),
+    max_queue=int(os.getenv('LLM_QUEUE_SIZE', '32')),
+    queue_timeout=float(os.getenv('LLM_QUEUE_TIMEOUT', '10')),
+    target_latency=float(os.getenv('LLM_TARGET_LATENCY', '8'))
+)
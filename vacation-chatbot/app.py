@@ -1,21 +1,44 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, g, Response
 from flask_cors import CORS
+import hmac
 import json
 import math
 import os
+import time
 import requests
+from urllib.parse import urlparse
 from dotenv import load_dotenv
 from datetime import datetime
+from functools import wraps
+
+import admission
+import fast_path
+import geometry
+import incremental
+import jobs
+import metrics
+import pair_table
+import profiling
+import prompts
+import responses
+import spatial
+import static_assets
+import structured_output
+import suggestions_store
+import tracing
 
 # Load environment variables
 load_dotenv()
 
-app = Flask(__name__)
+# Static files are served by static_assets with precompression and cache headers
+app = Flask(__name__, static_folder=None)
+app.json = responses.FastJSONProvider(app)
 CORS(app)
 
 # Get API key from environment
 LLAMA_API_KEY = os.getenv('LLAMA_API_KEY')
 GOOGLE_MAPS_API_KEY = os.getenv('GOOGLE_MAPS_API_KEY')
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
 
 # Debug logging
 print(f"🔍 Environment check:")
@@ -38,12 +61,52 @@ CARBON_FACTORS = {
 }
 
 
-CLIMATIQ_API_URL = "https://api.climatiq.io/estimate"
+# How itineraries are extracted from the LLM: 'markers' (**ITINERARY_DATA** blocks),
+# 'json_schema' (constrained JSON reply) or 'tool' (set_itinerary function call)
+LLM_MODE = os.getenv('LLM_MODE', 'markers').lower()
+# Answer plain city-list messages locally: 'on', 'off', or 'compare' (always ask
+# the LLM but report how the fast-path itinerary differs)
+FAST_PATH = os.getenv('FAST_PATH', 'on').lower()
+LLAMA_MODEL = "Llama-4-Maverick-17B-128E-Instruct-FP8"
+if FAST_PATH != 'off':
+    fast_path.get_index()
+suggestions_store.get_store()
+pair_table.get_table()
+# Routes with more stops than this are ordered with the spatial index
+SPATIAL_ROUTE_THRESHOLD = 64
+# /api/nearby-stops search radius and the distance at which a city counts as an existing stop
+NEARBY_DEFAULT_RADIUS_KM = 200
+NEARBY_MAX_RADIUS_KM = 1000
+NEARBY_SAME_CITY_KM = 15
+LLAMA_API_URL = os.getenv('LLAMA_API_URL', "https://api.llama.com/v1/chat/completions")
+CLIMATIQ_API_URL = os.getenv('CLIMATIQ_API_URL', "https://api.climatiq.io/estimate")
 CLIMATIQ_HEADERS = {
     "Authorization": f"Bearer {os.getenv('CLIMATIQ_API_KEY')}",
     "Content-Type": "application/json"
 }
 
+def upstream_post(url, **kwargs):
+    """POST to an upstream API, recording call counts, errors and latency per host"""
+    host = urlparse(url).netloc
+    metrics.UPSTREAM_IN_FLIGHT.inc(host=host)
+    start = time.perf_counter()
+    try:
+        response = requests.post(url, **kwargs)
+    except requests.Timeout:
+        metrics.UPSTREAM_ERRORS.inc(host=host, reason='timeout')
+        raise
+    except Exception:
+        metrics.UPSTREAM_ERRORS.inc(host=host, reason='connection')
+        raise
+    finally:
+        metrics.UPSTREAM_IN_FLIGHT.dec(host=host)
+        metrics.UPSTREAM_LATENCY.observe(time.perf_counter() - start, host=host)
+    
+    metrics.UPSTREAM_REQUESTS.inc(host=host, status=response.status_code)
+    if response.status_code >= 400:
+        metrics.UPSTREAM_ERRORS.inc(host=host, reason=f'http_{response.status_code}')
+    return response
+
 def calculate_carbon_with_climatiq(transport_mode, distance_km, occupancy=1):
     """Calculate carbon emissions using Climatiq API"""
     payload = {
@@ -55,12 +118,13 @@ def calculate_carbon_with_climatiq(transport_mode, distance_km, occupancy=1):
     }
     
     try:
-        response = requests.post(CLIMATIQ_API_URL, 
-                               headers=CLIMATIQ_HEADERS,
-                               json=payload,
-                               timeout=10)
+        response = upstream_post(CLIMATIQ_API_URL,
+                                 headers=CLIMATIQ_HEADERS,
+                                 json=payload,
+                                 timeout=10)
         response.raise_for_status()
         total_emissions = response.json().get('co2e', 0)
+        tracing.set_attribute('emissions.fallback', False)
         
         # For car transport, divide emissions by occupancy
         if transport_mode == 'car' and occupancy > 1:
@@ -69,143 +133,144 @@ def calculate_carbon_with_climatiq(transport_mode, distance_km, occupancy=1):
             return total_emissions
     except Exception as e:
         # Fallback to static factors if API fails
+        metrics.EMISSIONS_FALLBACKS.inc(mode=transport_mode)
+        tracing.set_attribute('emissions.fallback', True)
+        tracing.set_attribute('emissions.fallback_reason', str(e))
         base_emissions = CARBON_FACTORS.get(transport_mode, 0.21) * distance_km
         if transport_mode == 'car' and occupancy > 1:
             return base_emissions / occupancy
         else:
             return base_emissions
 
-def call_llama_api(user_message, trip_context=None, conversation_history=None, has_itinerary=False):
+@tracing.traced()
+def call_llama_api(user_message, trip_context=None, conversation_history=None, has_itinerary=False,
+                   conversation_id=None):
     """Call Llama API for intelligent chatbot responses"""
     if not LLAMA_API_KEY:
         return None, "API key not configured"
     
     try:
-        # System prompt that asks LLM to return structured data with coordinates
-        system_prompt = """You are an eco-friendly travel assistant that helps users plan sustainable itineraries.
-
-        YOUR PROCESS:
-        1. When users mention 2 or more cities, immediately create an itinerary - don't ask for more details
-        2. If they mention cities without specifying order, tell them you'll optimize the route for minimal emissions
-        3. Provide the complete itinerary right away - no need to ask for travel dates, preferences, or additional cities
-        4. Focus on the cities mentioned and create the best eco-friendly route between them
-
-        WHEN YOU HAVE ENOUGH CITIES TO CREATE AN ITINERARY, use this EXACT format:
-
-        "Great! I've created an eco-friendly itinerary for your trip. Here's what I've planned:
-
-        [Write a friendly, conversational message about the itinerary. Include:
-        - Mention the cities in order
-        - Highlight any eco-friendly aspects (like train options, scenic routes)
-        - Keep it warm and encouraging
-        - Don't mention technical details like coordinates or transport modes - those are handled automatically]
-
-        💡 **Eco Tip**: [Brief advice about sustainable travel for this route]
-
-        **ITINERARY_DATA**
-        {
-            "cities": [
-                {"name": "New York City, NY", "lat": 40.7128, "lng": -74.0060},
-                {"name": "Chicago, IL", "lat": 41.8781, "lng": -87.6298},
-                {"name": "Denver, CO", "lat": 39.7392, "lng": -104.9903}
-            ],
-            "segments": [
-                {
-                    "from": "New York City, NY",
-                    "to": "Chicago, IL",
-                    "transport_modes": ["car", "train", "flight", "bus"]
-                },
-                {
-                    "from": "Chicago, IL", 
-                    "to": "Denver, CO",
-                    "transport_modes": ["car", "flight", "bus"]
-                }
-            ]
-        }
-        **END_ITINERARY_DATA**"
-
-        CRITICAL REQUIREMENTS:
-        - ALWAYS include the **ITINERARY_DATA** section with accurate coordinates and realistic transport options
-        - Optimize city order for minimal total travel distance
-        - Use accurate latitude and longitude coordinates for each city
-        - For transport_modes, ALWAYS include ALL feasible options between cities:
-          * "car" - ALWAYS include for road connections (highways, major roads)
-          * "train" - include if passenger rail service exists (Amtrak, regional rail, high-speed rail)
-          * "flight" - include for commercial air routes (major airports)
-          * "bus" - include for intercity bus services (Greyhound, Megabus, regional carriers)
-        - Be INCLUSIVE rather than restrictive - if there's any reasonable way to travel between cities, include it
-        - Consider actual transportation infrastructure but don't be overly restrictive
-        - For US routes: Amtrak, major highways, commercial flights, and intercity buses are usually available
-        - For international routes: include all major transport options
-        - Be conversational and encouraging about sustainable travel
-        - If user mentions 2+ cities, create itinerary immediately - don't ask for more details
-        - Never ask for travel dates, mode preferences, or additional cities
-        - For non-itinerary responses, be helpful and conversational without the ITINERARY_DATA section"""
-        
-        # Build the conversation context
-        messages = [
-            {"role": "system", "content": system_prompt}
-        ]
-        
-        # Add itinerary status context
-        if has_itinerary:
-            itinerary_context = """IMPORTANT: There is already an existing trip itinerary. 
-            - If the user wants to modify the current itinerary, help them refine it
-            - If they mention new cities, integrate them into the existing plan
-            - If they want to start over, create a new itinerary
-            - Always maintain context of the current trip when responding"""
-            messages.append({"role": "system", "content": itinerary_context})
-        
-        # Add trip context and conversation history if available
-        if trip_context and trip_context.get('destinations'):
-            destinations = trip_context.get('destinations', [])
-            context = f"""Current trip planning status:
-            - {len(destinations)} destinations already identified: {', '.join([d.get('name', 'Unknown') for d in destinations])}
-            - Transportation preference: {trip_context.get('transportation', 'Not specified')}
-            - Any specific requirements: {trip_context.get('requirements', 'None specified')}
-            
-            Use this information to build upon the existing plan or help refine it."""
-            messages.append({"role": "system", "content": context})
-        
-        # Add conversation history if available (last 10 exchanges)
-        if conversation_history:
-            for msg in conversation_history[-20:]:  # Last 20 messages (10 exchanges)
-                messages.append({
-                    "role": msg.get('role', 'user'),
-                    "content": msg.get('content', '')
-                })
+        build_start = time.perf_counter()
         
-        # Add current user message
-        messages.append({"role": "user", "content": user_message})
+        # Static system prompt first, per-request context last, for provider prefix caching
+        prompt = prompts.build_messages('markers', user_message, trip_context, conversation_history, has_itinerary,
+                                        conversation_id)
         
-        # Call Llama API (adjust URL and format based on your Llama service)
-        headers = {
-            "Authorization": f"Bearer {LLAMA_API_KEY}",
-            "Content-Type": "application/json"
+        payload = {
+            "model": LLAMA_MODEL,
+            "messages": prompt.messages,
+            "max_completion_tokens": 500,
+            "temperature": 0.7
         }
+        metrics.CHAT_STAGE_LATENCY.observe(time.perf_counter() - build_start, stage='prompt_build')
+        
+        completion_message, error = post_llama(payload, prompt)
+        if error:
+            return None, error
+        return completion_message["content"]["text"], None
+        
+    except Exception as e:
+        tracing.set_error(str(e))
+        return None, f"Error calling Llama API: {str(e)}"
+
+@tracing.traced()
+def call_llama_structured(user_message, trip_context=None, conversation_history=None, has_itinerary=False,
+                          conversation_id=None):
+    """Call Llama API with schema-constrained output, returning (message, itinerary_data, error)"""
+    if not LLAMA_API_KEY:
+        return None, None, "API key not configured"
+    
+    try:
+        build_start = time.perf_counter()
+        
+        prompt = prompts.build_messages(LLM_MODE, user_message, trip_context, conversation_history, has_itinerary,
+                                        conversation_id)
         
         payload = {
-            "model": "Llama-4-Maverick-17B-128E-Instruct-FP8",
-            "messages": messages,
+            "model": LLAMA_MODEL,
+            "messages": prompt.messages,
             "max_completion_tokens": 500,
             "temperature": 0.7
         }
+        if LLM_MODE == 'tool':
+            payload["tools"] = [structured_output.itinerary_tool()]
+        else:
+            payload["response_format"] = structured_output.response_format()
+        metrics.CHAT_STAGE_LATENCY.observe(time.perf_counter() - build_start, stage='prompt_build')
         
-        # Use the correct Llama API endpoint
-        endpoint = "https://api.llama.com/v1/chat/completions"
+        completion_message, error = post_llama(payload, prompt)
+        if error:
+            return None, None, error
         
-        try:
-            response = requests.post(endpoint, headers=headers, json=payload, timeout=10)
-            if response.status_code == 200:
-                result = response.json()
-                return result["completion_message"]["content"]["text"], None
-            else:
-                return None, f"API request failed with status {response.status_code}: {response.text}"
-        except Exception as e:
-            return None, f"Error making API request: {str(e)}"
+        with metrics.time_stage('itinerary_parse'):
+            parsed = structured_output.parse_reply(completion_message, LLM_MODE)
+        
+        # One cheap repair pass on malformed output instead of dropping the itinerary
+        if parsed['errors']:
+            print(f"Structured itinerary invalid, attempting repair: {parsed['errors']}")
+            tracing.set_attribute('itinerary.repair_attempted', True)
+            repaired, repair_error = post_llama({
+                "model": LLAMA_MODEL,
+                "messages": structured_output.repair_messages(parsed),
+                "max_completion_tokens": 400,
+                "temperature": 0,
+                "response_format": {"type": "json_schema", "json_schema": {
+                    "name": "itinerary_repair", "schema": parsed['schema']}}
+            })
+            if repair_error:
+                # Keep the first reply's message; only the itinerary is lost
+                structured_output.ITINERARY_REPAIRS.inc(result='failed')
+                print(f"Structured itinerary repair failed: {repair_error}")
+            elif not structured_output.apply_repair(parsed, structured_output.completion_text(repaired)):
+                print(f"Structured itinerary repair failed: {parsed['errors']}")
+        
+        itinerary = structured_output.expand_itinerary(parsed['itinerary']) if parsed['itinerary'] else None
+        message = parsed['message']
+        if not message and itinerary:
+            # Tool-only replies carry no text; describe the itinerary from the fast-path template
+            message = fast_path.render_message(itinerary, itinerary['cities'])
+        elif not message:
+            # Never show the user raw or truncated JSON from an unparseable reply
+            message = structured_output.FALLBACK_MESSAGE
+        tracing.set_attribute('itinerary.found', itinerary is not None)
+        return message, itinerary, None
         
     except Exception as e:
-        return None, f"Error calling Llama API: {str(e)}"
+        tracing.set_error(str(e))
+        return None, None, f"Error calling Llama API: {str(e)}"
+
+def post_llama(payload, prompt=None):
+    """Send a chat completion request, returning (completion_message, error)"""
+    # Call Llama API (adjust URL and format based on your Llama service)
+    headers = {
+        "Authorization": f"Bearer {LLAMA_API_KEY}",
+        "Content-Type": "application/json"
+    }
+    tracing.set_attribute('llm.model', payload['model'])
+    tracing.set_attribute('llm.message_count', len(payload['messages']))
+    if prompt is not None:
+        for key, value in prompt.stats().items():
+            tracing.set_attribute(f'llm.prompt.{key}', value)
+    
+    start = time.perf_counter()
+    try:
+        with metrics.time_stage('llm_call'):
+            response = upstream_post(LLAMA_API_URL, headers=headers, json=payload, timeout=10)
+        # Let admission control adapt the concurrency limit to upstream health
+        admission.LLM_ADMISSION.observe(time.perf_counter() - start, response.status_code)
+        tracing.set_attribute('http.status_code', response.status_code)
+        if response.status_code == 200:
+            result = response.json()
+            if prompt is not None:
+                prompts.record_usage(prompt, result)
+            return result["completion_message"], None
+        else:
+            tracing.set_error(f"status {response.status_code}")
+            return None, f"API request failed with status {response.status_code}: {response.text}"
+    except Exception as e:
+        admission.LLM_ADMISSION.observe(time.perf_counter() - start)
+        tracing.set_error(str(e))
+        return None, f"Error making API request: {str(e)}"
 
 def calculate_distance(lat1, lng1, lat2, lng2):
     """Calculate distance between two points using Haversine formula"""
@@ -223,6 +288,7 @@ def calculate_distance(lat1, lng1, lat2, lng2):
     
     return distance
 
+@tracing.traced()
 def parse_itinerary_from_response(response_text):
     """Parse itinerary data from LLM response"""
     import re
@@ -230,6 +296,7 @@ def parse_itinerary_from_response(response_text):
     # Look for the ITINERARY_DATA section
     pattern = r'\*\*ITINERARY_DATA\*\*(.*?)\*\*END_ITINERARY_DATA\*\*'
     match = re.search(pattern, response_text, re.DOTALL)
+    tracing.set_attribute('itinerary.found', bool(match))
     
     if match:
         try:
@@ -237,6 +304,7 @@ def parse_itinerary_from_response(response_text):
             return json.loads(json_str)
         except json.JSONDecodeError as e:
             print(f"Error parsing itinerary JSON: {e}")
+            tracing.set_error(f"Error parsing itinerary JSON: {e}")
             return None
     
     return None
@@ -288,16 +356,29 @@ def calculate_transport_time(distance_km, transport_mode):
     
     return base_time + overhead_time.get(transport_mode, 0.5)
 
-def process_itinerary_with_climatiq(itinerary_data):
-    """Process itinerary and calculate transport options with Climatiq emissions"""
+@tracing.traced()
+def process_itinerary_with_climatiq(itinerary_data, previous=None, reused=None):
+    """
+    Process itinerary and calculate transport options with Climatiq emissions.
+    
+    previous is an incremental.SegmentIndex of the trip being edited; legs it
+    already covers are copied instead of recomputed, and their (new_index,
+    old_index) pairs are appended to reused.
+    """
     cities = itinerary_data.get('cities', [])
     llm_segments = itinerary_data.get('segments', [])
+    tracing.set_attribute('itinerary.city_count', len(cities))
+    tracing.set_attribute('itinerary.segment_count', len(llm_segments))
     
     if len(cities) < 2:
         return None
     
     segments = []
     
+    # Prebuilt pair table ids; cities missing from it are computed live
+    table = pair_table.get_table()
+    city_ids = pair_table.lookup_ids(cities)
+    
     # Process each segment with LLM-provided transport modes
     for i, llm_segment in enumerate(llm_segments):
         if i + 1 >= len(cities):
@@ -305,16 +386,35 @@ def process_itinerary_with_climatiq(itinerary_data):
             
         from_city = cities[i]
         to_city = cities[i + 1]
-        
-        # Calculate direct distance for reference
-        distance = calculate_distance(
-            from_city['lat'], from_city['lng'],
-            to_city['lat'], to_city['lng']
-        )
+        from_id, to_id = city_ids[i], city_ids[i + 1]
+        # Distinct places that matched one table entry would become a 0 km leg
+        in_table = from_id is not None and to_id is not None and from_id != to_id
         
         # Use LLM-provided transport modes
         available_modes = llm_segment.get('transport_modes', ['car'])  # Fallback to car
         
+        # Calculate direct distance for reference
+        with metrics.time_stage('distance'):
+            if in_table:
+                distance = table.distance(from_id, to_id)
+            else:
+                distance = calculate_distance(
+                    from_city['lat'], from_city['lng'],
+                    to_city['lat'], to_city['lng']
+                )
+        
+        # Unchanged legs of an edited trip keep their previous transport options
+        match = previous.reusable(from_city, to_city, available_modes) if previous else None
+        if match is not None:
+            old_index, previous_segment = match
+            with metrics.time_stage('geometry'):
+                segment_geometry = geometry.segment_geometry(from_city, to_city, available_modes)
+            segments.append(incremental.reuse_segment(
+                previous_segment, from_city, to_city, round(distance, 1), segment_geometry))
+            if reused is not None:
+                reused.append((i, old_index))
+            continue
+        
         transport_options = []
         
         # Calculate details for each LLM-provided transport mode
@@ -323,14 +423,24 @@ def process_itinerary_with_climatiq(itinerary_data):
             mode_distance = calculate_transport_distance(distance, mode)
             travel_time = calculate_transport_time(mode_distance, mode)
             
-            # Get carbon emissions from Climatiq (default occupancy for car)
-            try:
-                carbon_emissions = calculate_carbon_with_climatiq(mode, mode_distance, occupancy=1)
-            except Exception as e:
-                print(f"Climatiq API error for {mode}: {e}")
-                # Fallback to static calculation
-                base_emissions = CARBON_FACTORS.get(mode, 0.21) * mode_distance
-                carbon_emissions = base_emissions
+            # Prebuilt emissions for known city pairs, Climatiq for the rest
+            carbon_emissions = table.emissions(from_id, to_id, mode) if in_table else None
+            if carbon_emissions is None:
+                # Get carbon emissions from Climatiq (default occupancy for car)
+                try:
+                    with metrics.time_stage('emissions'), tracing.start_span('climatiq_lookup', {
+                        'segment.index': i,
+                        'segment.from': from_city['name'],
+                        'segment.to': to_city['name'],
+                        'transport.mode': mode,
+                        'transport.distance_km': round(mode_distance, 1)
+                    }):
+                        carbon_emissions = calculate_carbon_with_climatiq(mode, mode_distance, occupancy=1)
+                except Exception as e:
+                    print(f"Climatiq API error for {mode}: {e}")
+                    # Fallback to static calculation
+                    base_emissions = CARBON_FACTORS.get(mode, 0.21) * mode_distance
+                    carbon_emissions = base_emissions
             
             transport_options.append({
                 'mode': mode,
@@ -341,31 +451,116 @@ def process_itinerary_with_climatiq(itinerary_data):
                 'recommended': mode == 'train'  # Recommend train as most eco-friendly
             })
         
+        # Map lines per mode, so the front end needs no client-side routing calls
+        with metrics.time_stage('geometry'):
+            segment_geometry = geometry.segment_geometry(from_city, to_city, available_modes)
+        
         segments.append({
             'from': from_city['name'],
             'to': to_city['name'],
             'from_coords': {'lat': from_city['lat'], 'lng': from_city['lng']},
             'to_coords': {'lat': to_city['lat'], 'lng': to_city['lng']},
             'direct_distance_km': round(distance, 1),
-            'transport_options': transport_options
+            'transport_options': transport_options,
+            'geometry': segment_geometry
         })
     
     return segments
 
+@app.before_request
+def start_request_metrics():
+    """Track in-flight requests and start the latency timer"""
+    g.metrics_endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.metrics_start = time.perf_counter()
+    metrics.HTTP_IN_FLIGHT.inc(endpoint=g.metrics_endpoint)
+
+@app.after_request
+def record_request_metrics(response):
+    """Record request count and latency once the response is built"""
+    endpoint = g.get('metrics_endpoint', 'unmatched')
+    metrics.HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    if 'metrics_start' in g:
+        metrics.HTTP_LATENCY.observe(time.perf_counter() - g.metrics_start,
+                                     endpoint=endpoint, method=request.method)
+    return response
+
+@app.after_request
+def compress_large_response(response):
+    """Compress large JSON responses for clients that accept gzip or brotli"""
+    return responses.compress_response(response)
+
+@app.teardown_request
+def finish_request_metrics(exc=None):
+    """Release the in-flight slot even if the handler raised"""
+    if 'metrics_endpoint' in g:
+        metrics.HTTP_IN_FLIGHT.dec(endpoint=g.pop('metrics_endpoint'))
+
+def traced_request(func):
+    """Wrap a view in a root span, continuing an incoming W3C traceparent if present"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with tracing.start_span(f"{request.method} {request.path}",
+                                {'http.method': request.method, 'http.route': request.path},
+                                traceparent=request.headers.get('traceparent')) as span:
+            response = func(*args, **kwargs)
+            if span is not None:
+                status = response[1] if isinstance(response, tuple) else response.status_code
+                span.set_attribute('http.status_code', status)
+                if status >= 500:
+                    span.set_error(f"HTTP {status}")
+            return response
+    return wrapper
+
+def profiled_request(func):
+    """Sample the view's call stack when profiling is enabled, keeping slow requests"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if not profiling.should_profile(request.headers):
+            return func(*args, **kwargs)
+        
+        sampler = profiling.start_sampler()
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = func(*args, **kwargs)
+            status = response[1] if isinstance(response, tuple) else response.status_code
+            return response
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000
+            profiling.finish_sampler(sampler, request.path, duration_ms, status)
+    return wrapper
+
+def admin_authorized():
+    """Check the admin token; admin endpoints stay closed when ADMIN_TOKEN is unset"""
+    if not ADMIN_TOKEN:
+        return False
+    supplied = request.headers.get('X-Admin-Token', '')
+    return hmac.compare_digest(supplied.encode('utf-8'), ADMIN_TOKEN.encode('utf-8'))
+
+@app.route('/metrics')
+def metrics_route():
+    """Expose metrics in the Prometheus text format"""
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/')
 def index():
     """Serve the main application"""
-    return send_from_directory('public', 'index.html')
+    return static_assets.serve_static('public', 'index.html')
 
 @app.route('/app')
 def app_route():
     """Serve the main application"""
-    return send_from_directory('public', 'index.html')
+    return static_assets.serve_static('public', 'index.html')
 
 @app.route('/map.html')
 def map_route():
     """Serve the standalone map interface"""
-    return send_from_directory('public', 'map.html')
+    return static_assets.serve_static('public', 'map.html')
+
+@app.route('/static/<path:filename>')
+def static_route(filename):
+    """Serve fingerprinted assets generated by generate_html.py"""
+    return static_assets.serve_static(os.path.join('public', 'static'), filename)
 
 @app.route('/api/debug-env', methods=['GET'])
 def debug_env():
@@ -381,6 +576,15 @@ def debug_env():
         'google_maps_api_key_preview': GOOGLE_MAPS_API_KEY[:10] + '...' if GOOGLE_MAPS_API_KEY else None
     })
 
+@app.route('/api/prompt-variants', methods=['GET'])
+def prompt_variants():
+    """Static prompt sizes per mode and variant, and the active A/B weights"""
+    return jsonify({
+        'llm_mode': LLM_MODE,
+        'weights': dict(prompts.VARIANT_WEIGHTS),
+        'variants': prompts.variant_summary()
+    })
+
 @app.route('/api/test-llama', methods=['GET'])
 def test_llama():
     """Test if Llama API is working"""
@@ -403,7 +607,34 @@ def test_llama():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/admin/slow-requests', methods=['GET'])
+def slow_requests():
+    """List the slowest recent profiled requests"""
+    if not admin_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    limit = request.args.get('limit', type=int)
+    entries = profiling.SLOW_REQUESTS.slowest(limit)
+    return jsonify({
+        'profiling_mode': profiling.PROFILING_MODE,
+        'threshold_ms': profiling.PROFILING_SLOW_MS,
+        'requests': [{k: v for k, v in entry.items() if k != 'folded'} for entry in entries]
+    })
+
+@app.route('/api/admin/slow-requests/<profile_id>', methods=['GET'])
+def slow_request_profile(profile_id):
+    """Download one profile in collapsed-stack (flamegraph) format"""
+    if not admin_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    entry = profiling.SLOW_REQUESTS.get(profile_id)
+    if not entry:
+        return jsonify({'error': 'Profile not found'}), 404
+    return Response(entry['folded'] + '\n', mimetype='text/plain')
+
 @app.route('/api/chat', methods=['POST'])
+@traced_request
+@profiled_request
 def chat():
     """Intelligent chatbot endpoint using Llama API"""
     try:
@@ -411,6 +642,7 @@ def chat():
         user_message = data.get('message', '')
         trip_context = data.get('trip_context', {})
         conversation_history = data.get('conversation_history', [])
+        conversation_id = data.get('conversation_id')
         
         if not user_message:
             return jsonify({'error': 'Message is required'}), 400
@@ -418,30 +650,79 @@ def chat():
         # Determine if there's an existing itinerary
         has_itinerary = trip_context and trip_context.get('destinations') and len(trip_context.get('destinations', [])) > 1
         
-        # Call Llama API for intelligent response
-        ai_response, error = call_llama_api(user_message, trip_context, conversation_history, has_itinerary)
+        # Plain city lists can be answered without an LLM round trip
+        fast_cities, fast_itinerary = None, None
+        if FAST_PATH in ('on', 'compare'):
+            with metrics.time_stage('fast_path'):
+                fast_cities = fast_path.classify(user_message, has_itinerary)
+                if fast_cities:
+                    fast_itinerary = fast_path.build_itinerary(fast_cities, nearest_neighbor_route, calculate_distance)
+            fast_path.DECISIONS.inc(result='hit' if fast_itinerary else 'escalated')
+        
+        source = 'llm'
+        if fast_itinerary and FAST_PATH == 'on':
+            source = 'fast_path'
+            user_friendly_message = fast_path.render_message(fast_itinerary, fast_cities)
+            itinerary_data = fast_itinerary
+            error = None
+        else:
+            # Wait for an LLM slot; sessions with an existing itinerary are served first
+            priority = (admission.PRIORITY_EXISTING_ITINERARY if has_itinerary
+                        else admission.PRIORITY_NEW_CONVERSATION)
+            try:
+                ticket = admission.LLM_ADMISSION.acquire(priority)
+            except admission.Rejected as e:
+                response = jsonify({
+                    'error': 'The travel assistant is busy right now. Please try again shortly.',
+                    'retry_after': e.retry_after,
+                    'timestamp': datetime.now().isoformat()
+                })
+                response.headers['Retry-After'] = str(e.retry_after)
+                return response, 503
+            
+            # Call Llama API for intelligent response
+            with ticket:
+                if LLM_MODE in ('json_schema', 'tool'):
+                    # Schema-constrained reply: message and itinerary arrive already separated
+                    user_friendly_message, itinerary_data, error = call_llama_structured(
+                        user_message, trip_context, conversation_history, has_itinerary, conversation_id)
+                else:
+                    ai_response, error = call_llama_api(user_message, trip_context, conversation_history, has_itinerary,
+                                                        conversation_id)
         
         if error:
             return jsonify({
                 'error': f'Llama API is currently unavailable: {error}',
-                'timestamp': json.dumps(datetime.now().isoformat())
+                'timestamp': datetime.now().isoformat()
             }), 503
         
-        # Check if response contains itinerary data
-        itinerary_data = parse_itinerary_from_response(ai_response)
-        
-        # Extract user-friendly message for chat display
-        user_friendly_message = extract_user_friendly_message(ai_response)
+        if source == 'llm' and LLM_MODE not in ('json_schema', 'tool'):
+            with metrics.time_stage('itinerary_parse'):
+                # Check if response contains itinerary data
+                itinerary_data = parse_itinerary_from_response(ai_response)
+                
+                # Extract user-friendly message for chat display
+                user_friendly_message = extract_user_friendly_message(ai_response)
         
         response_data = {
             'response': user_friendly_message,
-            'timestamp': json.dumps(datetime.now().isoformat())
+            'source': source,
+            'timestamp': datetime.now().isoformat()
         }
         
+        if fast_itinerary and FAST_PATH == 'compare':
+            comparison = fast_path.compare_itineraries(fast_itinerary, itinerary_data)
+            print(f"⚖️ Fast path vs LLM: same order={comparison['same_order']}, same modes={comparison['same_modes']}")
+            response_data['fast_path_comparison'] = comparison
+        
         # If itinerary found, process it with Climatiq
         if itinerary_data and 'cities' in itinerary_data:
             try:
-                transport_segments = process_itinerary_with_climatiq(itinerary_data)
+                # When editing a trip, only new or changed legs are recomputed
+                old_segments = incremental.previous_segments(trip_context)
+                previous = incremental.SegmentIndex(old_segments) if old_segments else None
+                reused = []
+                transport_segments = process_itinerary_with_climatiq(itinerary_data, previous, reused)
                 
                 if transport_segments:
                     response_data['itinerary'] = {
@@ -449,17 +730,29 @@ def chat():
                         'segments': transport_segments,
                         'total_segments': len(transport_segments)
                     }
+                    if previous is not None:
+                        response_data['segment_delta'] = incremental.segment_delta(
+                            old_segments, transport_segments, reused)
+                    if previous is not None and data.get('segment_delta_only'):
+                        # Reused legs are null; the client fills them in from its own tripData
+                        response_data['itinerary']['segments'] = incremental.strip_reused(
+                            transport_segments, response_data['segment_delta'])
+                    elif responses.wants_compact():
+                        response_data['itinerary'] = responses.compact_itinerary(response_data['itinerary'])
                     
             except Exception as e:
                 print(f"Error processing itinerary: {e}")
                 # Don't fail the request, just log the error
         
-        return jsonify(response_data)
+        with metrics.time_stage('serialization'):
+            return jsonify(response_data)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/calculate-carbon', methods=['POST'])
+@traced_request
+@profiled_request
 def calculate_carbon():
     """Calculate carbon footprint for a trip"""
     try:
@@ -473,16 +766,21 @@ def calculate_carbon():
         
         total_distance = 0
         route_segments = []
+        table = pair_table.get_table()
+        city_ids = pair_table.lookup_ids(destinations)
         
         # Calculate total distance
         for i in range(len(destinations) - 1):
             start = destinations[i]
             end = destinations[i + 1]
             
-            distance = calculate_distance(
-                start['lat'], start['lng'],
-                end['lat'], end['lng']
-            )
+            if city_ids[i] is not None and city_ids[i + 1] is not None and city_ids[i] != city_ids[i + 1]:
+                distance = table.distance(city_ids[i], city_ids[i + 1])
+            else:
+                distance = calculate_distance(
+                    start['lat'], start['lng'],
+                    end['lat'], end['lng']
+                )
             
             total_distance += distance
             route_segments.append({
@@ -523,6 +821,7 @@ def calculate_carbon():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/recalculate-car-emissions', methods=['POST'])
+@traced_request
 def recalculate_car_emissions():
     """Recalculate emissions for car transport with different occupancy"""
     try:
@@ -555,78 +854,38 @@ def recalculate_car_emissions():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/suggestions', methods=['POST'])
+@app.route('/api/suggestions', methods=['GET', 'POST'])
 def get_suggestions():
     """Get eco-friendly travel suggestions"""
     try:
-        data = request.get_json()
-        destination = data.get('destination', '').lower()
-        preferences = data.get('preferences', [])
-        
-        # Sample eco-friendly suggestions
-        suggestions = {
-            'paris': {
-                'transport': [
-                    'Take the Eurostar from London (90% less CO2 than flying)',
-                    'Use the extensive metro and bus system',
-                    'Rent Vélib bicycles for short trips'
-                ],
-                'accommodation': [
-                    'Hotel des Grands Boulevards (Green Key certified)',
-                    'Le Citizen Hotel (solar panels, local sourcing)',
-                    'Mama Shelter (waste reduction programs)'
-                ],
-                'activities': [
-                    'Walking tour of historic neighborhoods',
-                    'Visit Jardin du Luxembourg by foot',
-                    'Picnic with local market produce'
-                ]
-            },
-            'amsterdam': {
-                'transport': [
-                    'Take the train from major European cities',
-                    'Rent a bicycle - Amsterdam has 400km of bike paths',
-                    'Use the electric tram and bus network'
-                ],
-                'accommodation': [
-                    'Conscious Hotel (carbon-neutral, organic breakfast)',
-                    'Hotel V Fizeaustraat (Green Key, local partnerships)',
-                    'ClinkNOORD (sustainable hostel with solar panels)'
-                ],
-                'activities': [
-                    'Canal tour with electric boats',
-                    'Visit Vondelpark by bike',
-                    'Explore local farmers markets'
-                ]
-            }
-        }
-        
-        # Default suggestions if destination not found
-        default_suggestions = {
-            'transport': [
-                'Choose trains over planes when possible',
-                'Use public transportation at destination',
-                'Consider electric vehicle rentals'
-            ],
-            'accommodation': [
-                'Look for Green Key or LEED certified hotels',
-                'Choose accommodations with renewable energy',
-                'Stay in locally-owned establishments'
-            ],
-            'activities': [
-                'Explore on foot or by bicycle',
-                'Support local businesses and markets',
-                'Choose outdoor activities over indoor attractions'
-            ]
+        if request.method == 'GET':
+            # GET ?destination=paris&preferences=bike,budget is cacheable by browsers and proxies
+            destination = request.args.get('destination', '')
+            preferences = [p for p in request.args.get('preferences', '').split(',') if p]
+        else:
+            data = request.get_json()
+            destination = data.get('destination', '')
+            preferences = data.get('preferences', [])
+
+        result, match_type, etag = suggestions_store.get_store().suggest(destination, preferences)
+        headers = {
+            'ETag': etag,
+            'Cache-Control': 'public, max-age=300',
+            'X-Suggestions-Match': match_type
         }
-        
-        result = suggestions.get(destination, default_suggestions)
-        return jsonify(result)
+        if request.method == 'GET' and static_assets.etag_matches(etag):
+            return Response(status=304, headers=headers)
+
+        response = jsonify(result)
+        response.headers.update(headers)
+        return response
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/optimize-route', methods=['POST'])
+@traced_request
+@profiled_request
 def optimize_route():
     """Optimize route for minimal carbon impact"""
     try:
@@ -634,46 +893,236 @@ def optimize_route():
         destinations = data.get('destinations', [])
         transport_mode = data.get('transport_mode', 'car')
         
-        if len(destinations) < 3:
-            return jsonify({'optimized_route': destinations})
+        return jsonify(optimize_route_result(destinations, transport_mode))
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def optimize_route_result(destinations, transport_mode='car'):
+    """Optimized stop order and carbon savings; also runs as the 'optimize_route' job"""
+    if len(destinations) < 3:
+        return {'optimized_route': destinations}
+    
+    optimized = nearest_neighbor_route(destinations)
+    
+    # Calculate carbon savings
+    original_carbon = calculate_route_carbon(destinations, transport_mode)
+    optimized_carbon = calculate_route_carbon(optimized, transport_mode)
+    savings = original_carbon - optimized_carbon
+    
+    return {
+        'optimized_route': optimized,
+        'original_carbon_kg': round(original_carbon, 2),
+        'optimized_carbon_kg': round(optimized_carbon, 2),
+        'carbon_savings_kg': round(savings, 2),
+        'savings_percentage': round((savings / original_carbon * 100), 1) if original_carbon > 0 else 0
+    }
+
+def score_route_result(destinations, optimize=False):
+    """Distance and carbon of a route for every transport mode; runs as the 'score_route' job"""
+    route = nearest_neighbor_route(destinations) if optimize else destinations
+    total_distance = sum(calculate_distance(a['lat'], a['lng'], b['lat'], b['lng'])
+                         for a, b in zip(route, route[1:]))
+    return {
+        'route': route,
+        'total_distance_km': round(total_distance, 2),
+        'carbon_kg': {
+            mode: round(calculate_transport_distance(total_distance, mode) * CARBON_FACTORS[mode], 2)
+            for mode in structured_output.TRANSPORT_MODES
+        }
+    }
+
+jobs.register('optimize_route', optimize_route_result)
+jobs.register('score_route', score_route_result)
+
+@app.route('/api/route-geometry', methods=['POST'])
+@traced_request
+def route_geometry():
+    """Encoded map polylines for each leg of a route"""
+    try:
+        data = request.get_json()
+        destinations = data.get('destinations', [])
+        modes = data.get('modes', 'train')
+        zoom = min(max(int(data.get('zoom', geometry.GEOMETRY_ZOOM)), 0), 20)
+        
+        if len(destinations) < 2:
+            return jsonify({'error': 'At least 2 destinations required'}), 400
+        # One mode for every leg, or a list with one mode per leg
+        if isinstance(modes, str):
+            modes = [modes] * (len(destinations) - 1)
+        if len(modes) != len(destinations) - 1:
+            return jsonify({'error': 'modes must have one entry per leg'}), 400
+        
+        segments = []
+        for start, end, mode in zip(destinations, destinations[1:], modes):
+            segments.append({
+                'from': start.get('name'),
+                'to': end.get('name'),
+                'mode': mode,
+                'polyline': geometry.encode_polyline(geometry.segment_points(start, end, mode, zoom))
+            })
+        
+        return jsonify({'zoom': zoom, 'segments': segments})
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs', methods=['POST'])
+@traced_request
+def submit_job():
+    """Queue a background optimization or scoring job"""
+    try:
+        data = request.get_json()
+        kind = data.get('kind')
+        params = data.get('params', {})
+        if not isinstance(params, dict):
+            return jsonify({'error': 'params must be an object'}), 400
+        
+        try:
+            job, created = jobs.JOBS.submit(kind, params)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except jobs.QueueFull as e:
+            response = jsonify({'error': 'Too many background jobs are pending. Please try again shortly.',
+                                'retry_after': e.retry_after})
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response, 503
+        
+        body = job.to_dict()
+        body['deduplicated'] = not created
+        body['status_url'] = f"/api/jobs/{job.id}"
+        body['result_url'] = f"/api/jobs/{job.id}/result"
+        response = jsonify(body)
+        response.headers['Location'] = body['status_url']
+        return response, 200 if job.status == jobs.SUCCEEDED else 202
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET', 'DELETE'])
+def job_status(job_id):
+    """Get a job's status, or cancel it with DELETE"""
+    job = jobs.JOBS.cancel(job_id) if request.method == 'DELETE' else jobs.JOBS.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    """Get a finished job's result"""
+    job = jobs.JOBS.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    if job.status == jobs.SUCCEEDED:
+        return jsonify({'job_id': job.id, 'kind': job.kind, 'result': job.result})
+    if job.status in jobs.FINISHED_STATUSES:
+        return jsonify(job.to_dict()), 409
+    response = jsonify(job.to_dict())
+    response.headers['Retry-After'] = '1'
+    return response, 202
+
+@app.route('/api/nearby-stops', methods=['POST'])
+@traced_request
+def nearby_stops():
+    """Suggest nearby cities that add the least carbon as extra stops on a route"""
+    try:
+        data = request.get_json()
+        destinations = data.get('destinations', [])
+        radius_km = min(float(data.get('radius_km', NEARBY_DEFAULT_RADIUS_KM)), NEARBY_MAX_RADIUS_KM)
+        limit = min(int(data.get('limit', 3)), 10)
+        
+        if not destinations:
+            return jsonify({'error': 'At least 1 destination required'}), 400
         
-        # Simple optimization: sort by geographic proximity
-        # Start with first destination, then find nearest unvisited destination
-        optimized = [destinations[0]]
-        remaining = destinations[1:]
+        index = spatial.get_city_index()
         
-        while remaining:
-            current = optimized[-1]
-            nearest_index = 0
-            min_distance = float('inf')
+        # Indexed cities that already are stops on the route
+        on_route = set()
+        for stop in destinations:
+            for _, i in index.nearest(stop['lat'], stop['lng'], k=1, max_km=NEARBY_SAME_CITY_KM):
+                on_route.add(i)
+        
+        stops = []
+        for position, stop in enumerate(destinations):
+            next_stop = destinations[position + 1] if position + 1 < len(destinations) else None
+            # The closest indexed city stands in for the stop when choosing ground transport
+            _, anchor_index = index.nearest(stop['lat'], stop['lng'])[0]
+            anchor = index.items[anchor_index]
             
-            for i, dest in enumerate(remaining):
-                distance = calculate_distance(
-                    current['lat'], current['lng'],
-                    dest['lat'], dest['lng']
-                )
-                if distance < min_distance:
-                    min_distance = distance
-                    nearest_index = i
+            candidates = []
+            for distance, i in index.within(stop['lat'], stop['lng'], radius_km):
+                if i in on_route:
+                    continue
+                city = index.items[i]
+                # Extra distance for visiting the city on the way to the next stop
+                if next_stop:
+                    detour = (distance
+                              + calculate_distance(city['lat'], city['lng'], next_stop['lat'], next_stop['lng'])
+                              - calculate_distance(stop['lat'], stop['lng'], next_stop['lat'], next_stop['lng']))
+                else:
+                    detour = distance
+                modes = fast_path.transport_modes(anchor, city, distance)
+                best_mode = min(modes, key=lambda mode: CARBON_FACTORS[mode])
+                candidates.append({
+                    'name': city['name'],
+                    'lat': city['lat'],
+                    'lng': city['lng'],
+                    'distance_km': round(distance, 1),
+                    'detour_km': round(detour, 1),
+                    'transport_modes': modes,
+                    'recommended_mode': best_mode,
+                    'added_carbon_kg': round(
+                        calculate_transport_distance(detour, best_mode) * CARBON_FACTORS[best_mode], 2)
+                })
             
-            optimized.append(remaining.pop(nearest_index))
-        
-        # Calculate carbon savings
-        original_carbon = calculate_route_carbon(destinations, transport_mode)
-        optimized_carbon = calculate_route_carbon(optimized, transport_mode)
-        savings = original_carbon - optimized_carbon
+            candidates.sort(key=lambda c: (c['added_carbon_kg'], c['distance_km']))
+            stops.append({'name': stop.get('name'), 'nearby': candidates[:limit]})
         
-        return jsonify({
-            'optimized_route': optimized,
-            'original_carbon_kg': round(original_carbon, 2),
-            'optimized_carbon_kg': round(optimized_carbon, 2),
-            'carbon_savings_kg': round(savings, 2),
-            'savings_percentage': round((savings / original_carbon * 100), 1) if original_carbon > 0 else 0
-        })
+        return jsonify({'radius_km': radius_km, 'stops': stops})
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def nearest_neighbor_route(destinations):
+    """Order destinations greedily by geographic proximity"""
+    if not destinations:
+        return []
+    
+    if len(destinations) > SPATIAL_ROUTE_THRESHOLD:
+        # Long routes: k-d tree lookups instead of rescanning every remaining stop
+        index = spatial.SpatialIndex.from_items(destinations)
+        order = [0]
+        index.remove(0)
+        while len(order) < len(destinations):
+            current = destinations[order[-1]]
+            _, nearest_index = index.nearest(current['lat'], current['lng'])[0]
+            index.remove(nearest_index)
+            order.append(nearest_index)
+        return [destinations[i] for i in order]
+    
+    # Simple optimization: sort by geographic proximity
+    # Start with first destination, then find nearest unvisited destination
+    optimized = [destinations[0]]
+    remaining = destinations[1:]
+    
+    while remaining:
+        current = optimized[-1]
+        nearest_index = 0
+        min_distance = float('inf')
+        
+        for i, dest in enumerate(remaining):
+            distance = calculate_distance(
+                current['lat'], current['lng'],
+                dest['lat'], dest['lng']
+            )
+            if distance < min_distance:
+                min_distance = distance
+                nearest_index = i
+        
+        optimized.append(remaining.pop(nearest_index))
+    
+    return optimized
+
 def calculate_route_carbon(destinations, transport_mode):
     """Helper function to calculate total carbon for a route"""
     if len(destinations) < 2:
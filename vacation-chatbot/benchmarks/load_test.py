@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Load Test
+End-to-end benchmark of the Flask API against local Llama and Climatiq stubs
+
+Drives /api/chat, /api/calculate-carbon, /api/optimize-route and
+/api/recalculate-car-emissions at several concurrency levels and itinerary
+sizes, then reports throughput and latency percentiles. Results can be saved
+as a baseline and compared against on later runs.
+
+Usage:
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --concurrency 1,8,32 --sizes 2,10,50 --requests 200
+    python benchmarks/load_test.py --save-baseline benchmarks/baseline.json
+    python benchmarks/load_test.py --baseline benchmarks/baseline.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stub_upstreams import StubConfig, StubServer, make_cities
+
+ENDPOINTS = ['chat', 'calculate-carbon', 'optimize-route', 'recalculate-car-emissions']
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+def build_payload(endpoint, size):
+    """Request body for one call to `endpoint` with an itinerary of `size` cities"""
+    if endpoint == 'chat':
+        return {'message': f'Plan an eco-friendly trip through {size} European cities'}
+    if endpoint == 'calculate-carbon':
+        return {'destinations': make_cities(size), 'transport_mode': 'train'}
+    if endpoint == 'optimize-route':
+        destinations = make_cities(size)
+        random.Random(size).shuffle(destinations)
+        return {'destinations': destinations, 'transport_mode': 'car'}
+    return {'segment_index': 0, 'occupancy': 3, 'distance_km': 500}
+
+
+class AppServer:
+    """The Flask app served by werkzeug on a background thread"""
+
+    def __init__(self):
+        from werkzeug.serving import make_server
+        import app as backend
+
+        self.server = make_server('127.0.0.1', 0, backend.app, threaded=True)
+        self.thread = threading.Thread(target=self.server.serve_forever, name='backend', daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+
+def run_scenario(base_url, endpoint, size, concurrency, total_requests):
+    """Fire `total_requests` calls with `concurrency` workers and summarize latency"""
+    url = f"{base_url}/api/{endpoint}"
+    payload = build_payload(endpoint, size)
+    local = threading.local()
+
+    def one_call(_):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            response = session.post(url, json=payload, timeout=60)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    # Warm up connections and any lazy initialization
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one_call, range(min(concurrency, total_requests))))
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one_call, range(total_requests)))
+    wall = time.perf_counter() - wall_start
+
+    latencies = sorted(latency * 1000 for latency, _ in results)
+    errors = sum(1 for _, ok in results if not ok)
+    return {
+        'endpoint': endpoint,
+        'size': size,
+        'concurrency': concurrency,
+        'requests': total_requests,
+        'errors': errors,
+        'throughput_rps': round(total_requests / wall, 2) if wall > 0 else 0.0,
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p90_ms': round(percentile(latencies, 90), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'max_ms': round(latencies[-1], 2) if latencies else 0.0
+    }
+
+
+def scenario_key(result):
+    return f"{result['endpoint']}|{result['size']}|{result['concurrency']}"
+
+
+def print_results(results, baseline=None):
+    header = f"{'endpoint':<28}{'size':>6}{'conc':>6}{'rps':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'errors':>8}"
+    if baseline:
+        header += f"{'Δp50':>9}{'Δrps':>9}"
+    print(header)
+    print('-' * len(header))
+    for result in results:
+        line = (f"{result['endpoint']:<28}{result['size']:>6}{result['concurrency']:>6}"
+                f"{result['throughput_rps']:>10.1f}{result['p50_ms']:>10.1f}{result['p90_ms']:>10.1f}"
+                f"{result['p99_ms']:>10.1f}{result['errors']:>8}")
+        if baseline:
+            base = baseline.get(scenario_key(result))
+            if base:
+                line += f"{_delta(result['p50_ms'], base['p50_ms']):>9}{_delta(result['throughput_rps'], base['throughput_rps']):>9}"
+            else:
+                line += f"{'new':>9}{'new':>9}"
+        print(line)
+
+
+def _delta(current, previous):
+    if not previous:
+        return 'n/a'
+    return f"{(current - previous) / previous * 100:+.0f}%"
+
+
+def parse_int_list(value):
+    return [int(v) for v in value.split(',') if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end API benchmark with stubbed upstreams')
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS),
+                        help='Comma-separated endpoints to drive (default: all)')
+    parser.add_argument('--concurrency', type=parse_int_list, default=[1, 4, 16])
+    parser.add_argument('--sizes', type=parse_int_list, default=[2, 5, 15],
+                        help='Itinerary sizes (cities per request)')
+    parser.add_argument('--requests', type=int, default=100, help='Requests per scenario')
+    parser.add_argument('--llm-latency-ms', type=float, default=50)
+    parser.add_argument('--climatiq-latency-ms', type=float, default=10)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Upstream failure probability')
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--save-baseline', help='Write results to this JSON file')
+    parser.add_argument('--baseline', help='Compare results against this JSON file')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    endpoints = [e.strip() for e in args.endpoints.split(',') if e.strip()]
+
+    llama_config = StubConfig(args.llm_latency_ms, args.jitter_ms, args.error_rate)
+    climatiq_config = StubConfig(args.climatiq_latency_ms, args.jitter_ms, args.error_rate)
+    llama = StubServer('llama', llama_config).start()
+    climatiq = StubServer('climatiq', climatiq_config).start()
+
+    # The backend reads its upstream URLs and keys at import time
+    os.environ['LLAMA_API_URL'] = llama.url
+    os.environ['CLIMATIQ_API_URL'] = climatiq.url
+    os.environ.setdefault('LLAMA_API_KEY', 'benchmark-key')
+    os.environ.setdefault('CLIMATIQ_API_KEY', 'benchmark-key')
+    backend = AppServer().start()
+
+    print(f"🏁 Benchmarking {backend.base_url} (LLM {args.llm_latency_ms} ms, Climatiq {args.climatiq_latency_ms} ms, "
+          f"error rate {args.error_rate})\n")
+
+    results = []
+    try:
+        for endpoint in endpoints:
+            # Occupancy recalculation does not depend on itinerary size
+            sizes = args.sizes if endpoint != 'recalculate-car-emissions' else [1]
+            for size in sizes:
+                llama_config.itinerary_size = max(size, 2)
+                for concurrency in args.concurrency:
+                    result = run_scenario(backend.base_url, endpoint, size, concurrency, args.requests)
+                    results.append(result)
+                    print(f"   {endpoint} size={size} conc={concurrency}: "
+                          f"{result['throughput_rps']} rps, p99 {result['p99_ms']} ms")
+    finally:
+        backend.stop()
+        llama.stop()
+        climatiq.stop()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = {scenario_key(r): r for r in json.load(f)['results']}
+
+    print()
+    print_results(results, baseline)
+
+    if args.save_baseline:
+        report = {
+            'created_at': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'settings': {k: v for k, v in vars(args).items() if k not in ('save_baseline', 'baseline')},
+            'results': results
+        }
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Saved baseline to {args.save_baseline}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Micro Benchmarks
+Timings for the pure-compute hot paths in app.py, parameterized by city count
+
+Covers calculate_distance, the nearest-neighbour loop behind
+/api/optimize-route, calculate_route_carbon, itinerary parsing and message
+extraction on large LLM responses, and process_itinerary_with_climatiq with
+the Climatiq call replaced by the static emission factors. The spatial_*
+cases time single k-nearest and radius queries against an index of `size`
+points (try --only spatial_knn_query,spatial_radius_query --sizes 100000).
+
+Usage:
+    python benchmarks/micro.py
+    python benchmarks/micro.py --sizes 2,10,100,500 --output benchmarks/micro_baseline.json
+    python benchmarks/micro.py --baseline benchmarks/micro_baseline.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stub_upstreams import make_cities, make_itinerary_response
+
+DEFAULT_SIZES = [2, 10, 50, 100, 500]
+
+
+@contextmanager
+def static_emissions(backend):
+    """Replace the Climatiq call with the static factors for the duration of the block"""
+    original = backend.calculate_carbon_with_climatiq
+
+    def static(transport_mode, distance_km, occupancy=1):
+        emissions = backend.CARBON_FACTORS.get(transport_mode, 0.21) * distance_km
+        return emissions / occupancy if transport_mode == 'car' and occupancy > 1 else emissions
+
+    backend.calculate_carbon_with_climatiq = static
+    try:
+        yield
+    finally:
+        backend.calculate_carbon_with_climatiq = original
+
+
+def build_cases(backend):
+    """Map benchmark name -> factory(size) returning a zero-argument callable"""
+
+    def distance_case(size):
+        cities = make_cities(size)
+        pairs = [(a['lat'], a['lng'], b['lat'], b['lng']) for a in cities for b in cities]
+
+        def run():
+            for lat1, lng1, lat2, lng2 in pairs:
+                backend.calculate_distance(lat1, lng1, lat2, lng2)
+        return run
+
+    def optimize_case(size):
+        cities = make_cities(size)
+        return lambda: backend.nearest_neighbor_route(cities)
+
+    def route_carbon_case(size):
+        cities = make_cities(size)
+        return lambda: backend.calculate_route_carbon(cities, 'train')
+
+    def parse_case(size):
+        text = make_itinerary_response(size)
+        return lambda: backend.parse_itinerary_from_response(text)
+
+    def extract_case(size):
+        text = make_itinerary_response(size)
+        return lambda: backend.extract_user_friendly_message(text)
+
+    def process_case(size):
+        itinerary = backend.parse_itinerary_from_response(make_itinerary_response(size))
+        return lambda: backend.process_itinerary_with_climatiq(itinerary)
+
+    def spatial_index(size):
+        import spatial
+        return spatial.SpatialIndex.from_items(make_cities(size))
+
+    def knn_case(size):
+        index = spatial_index(size)
+        return lambda: index.nearest(50.0, 8.0, k=5)
+
+    def radius_case(size):
+        index = spatial_index(size)
+        return lambda: index.within(50.0, 8.0, 100)
+
+    return {
+        'calculate_distance_all_pairs': distance_case,
+        'nearest_neighbor_route': optimize_case,
+        'calculate_route_carbon': route_carbon_case,
+        'parse_itinerary_from_response': parse_case,
+        'extract_user_friendly_message': extract_case,
+        'process_itinerary_with_climatiq': process_case,
+        'spatial_knn_query': knn_case,
+        'spatial_radius_query': radius_case,
+    }
+
+
+def time_callable(func, min_time=0.2, repeats=5):
+    """Best-of-`repeats` timing with an auto-scaled loop count, in microseconds per call"""
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / repeats or loops >= 1_000_000:
+            break
+        loops *= 2
+
+    per_call = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        per_call.append((time.perf_counter() - start) / loops * 1e6)
+    return {
+        'loops': loops,
+        'repeats': repeats,
+        'min_us': round(min(per_call), 3),
+        'median_us': round(statistics.median(per_call), 3),
+        'mean_us': round(statistics.fmean(per_call), 3)
+    }
+
+
+def parse_int_list(value):
+    return [int(v) for v in value.split(',') if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro benchmarks for app.py hot paths')
+    parser.add_argument('--sizes', type=parse_int_list, default=DEFAULT_SIZES, help='City counts')
+    parser.add_argument('--only', help='Comma-separated benchmark names to run')
+    parser.add_argument('--min-time', type=float, default=0.2, help='Target seconds per measurement')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--output', help='Write JSON results to this file (default: stdout)')
+    parser.add_argument('--baseline', help='Compare against a previous JSON result file')
+    args = parser.parse_args()
+
+    import app as backend
+
+    cases = build_cases(backend)
+    if args.only:
+        wanted = {name.strip() for name in args.only.split(',')}
+        cases = {name: case for name, case in cases.items() if name in wanted}
+
+    results = []
+    with static_emissions(backend):
+        for name, factory in cases.items():
+            for size in args.sizes:
+                timing = time_callable(factory(max(size, 2)), args.min_time, args.repeats)
+                results.append({'name': name, 'size': size, **timing})
+                print(f"   {name:<34} n={size:<5} {timing['min_us']:>14.1f} µs", file=sys.stderr)
+
+    report = {
+        'created_at': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results
+    }
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            previous = {(r['name'], r['size']): r for r in json.load(f)['results']}
+        for result in results:
+            base = previous.get((result['name'], result['size']))
+            if base and base['min_us']:
+                result['change_pct'] = round((result['min_us'] - base['min_us']) / base['min_us'] * 100, 1)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+        print(f"💾 Wrote {len(results)} results to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Stub Upstreams
+Local HTTP servers emulating the Llama chat completions and Climatiq estimate APIs
+
+Both stubs support a configurable latency and error rate. The Llama stub
+returns a canned response with an **ITINERARY_DATA** block containing a
+configurable number of cities.
+"""
+
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Real cities so distances and transport modes look like production traffic
+SAMPLE_CITIES = [
+    ("Paris, France", 48.8566, 2.3522),
+    ("Amsterdam, Netherlands", 52.3676, 4.9041),
+    ("Berlin, Germany", 52.5200, 13.4050),
+    ("Prague, Czech Republic", 50.0755, 14.4378),
+    ("Vienna, Austria", 48.2082, 16.3738),
+    ("Budapest, Hungary", 47.4979, 19.0402),
+    ("Munich, Germany", 48.1351, 11.5820),
+    ("Zurich, Switzerland", 47.3769, 8.5417),
+    ("Milan, Italy", 45.4642, 9.1900),
+    ("Lyon, France", 45.7640, 4.8357),
+    ("Barcelona, Spain", 41.3851, 2.1734),
+    ("Madrid, Spain", 40.4168, -3.7038),
+    ("Lisbon, Portugal", 38.7223, -9.1393),
+    ("Brussels, Belgium", 50.8503, 4.3517),
+    ("London, UK", 51.5074, -0.1278),
+    ("Copenhagen, Denmark", 55.6761, 12.5683),
+]
+
+
+class StubConfig:
+    """Mutable settings shared between a stub server and the benchmark driver"""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, itinerary_size=3):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.itinerary_size = itinerary_size
+        self.request_count = 0
+        self._lock = threading.Lock()
+
+    def count_request(self):
+        with self._lock:
+            self.request_count += 1
+
+    def delay(self):
+        latency = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if latency > 0:
+            time.sleep(latency / 1000.0)
+
+    def should_fail(self):
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+
+def make_cities(count):
+    """Build a list of `count` cities, jittering repeats so every stop is distinct"""
+    cities = []
+    for i in range(count):
+        name, lat, lng = SAMPLE_CITIES[i % len(SAMPLE_CITIES)]
+        lap = i // len(SAMPLE_CITIES)
+        if lap:
+            name = f"{name} #{lap + 1}"
+            lat += 0.1 * lap * math.sin(i)
+            lng += 0.1 * lap * math.cos(i)
+        cities.append({"name": name, "lat": round(lat, 4), "lng": round(lng, 4)})
+    return cities
+
+
+def make_itinerary_response(city_count):
+    """Canned LLM text with an **ITINERARY_DATA** block for `city_count` cities"""
+    cities = make_cities(city_count)
+    segments = [
+        {
+            "from": cities[i]["name"],
+            "to": cities[i + 1]["name"],
+            "transport_modes": ["car", "train", "flight", "bus"]
+        }
+        for i in range(len(cities) - 1)
+    ]
+    itinerary = json.dumps({"cities": cities, "segments": segments}, indent=4)
+    names = ', '.join(city["name"] for city in cities)
+    return (
+        "Great! I've created an eco-friendly itinerary for your trip. Here's what I've planned:\n\n"
+        f"You'll travel through {names}, with train options wherever they exist.\n\n"
+        "💡 **Eco Tip**: Trains emit a fraction of the CO2 of short-haul flights.\n\n"
+        f"**ITINERARY_DATA**\n{itinerary}\n**END_ITINERARY_DATA**"
+    )
+
+
+def _make_handler(config, respond):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            config.count_request()
+            length = int(self.headers.get('Content-Length', 0))
+            body = self.rfile.read(length) if length else b''
+            config.delay()
+            if config.should_fail():
+                self._send(503, {"error": "stub upstream failure"})
+                return
+            try:
+                payload = json.loads(body or b'{}')
+            except json.JSONDecodeError:
+                self._send(400, {"error": "invalid json"})
+                return
+            self._send(200, respond(payload))
+
+        def _send(self, status, data):
+            encoded = json.dumps(data).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(encoded)))
+            self.end_headers()
+            self.wfile.write(encoded)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def _llama_response(config):
+    def respond(payload):
+        return {"completion_message": {"content": {"text": make_itinerary_response(config.itinerary_size)}}}
+    return respond
+
+
+def _climatiq_response(config):
+    def respond(payload):
+        distance = float(payload.get("quantity", 0) or 0)
+        mode = payload.get("emission_factor", {}).get("transport", "car")
+        factors = {'car': 0.2, 'train': 0.035, 'bus': 0.08, 'flight': 0.25}
+        return {"co2e": distance * factors.get(mode, 0.2), "co2e_unit": "kg"}
+    return respond
+
+
+class StubServer:
+    """A stub upstream running on a background thread"""
+
+    def __init__(self, kind, config, host='127.0.0.1', port=0):
+        respond = _llama_response(config) if kind == 'llama' else _climatiq_response(config)
+        self.kind = kind
+        self.config = config
+        self.server = ThreadingHTTPServer((host, port), _make_handler(config, respond))
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name=f'{kind}-stub', daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        path = '/v1/chat/completions' if self.kind == 'llama' else '/estimate'
+        return f"http://{host}:{port}{path}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Run the Llama and Climatiq stubs standalone')
+    parser.add_argument('--llama-port', type=int, default=8801)
+    parser.add_argument('--climatiq-port', type=int, default=8802)
+    parser.add_argument('--latency-ms', type=float, default=100)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--cities', type=int, default=3)
+    args = parser.parse_args()
+
+    llama = StubServer('llama', StubConfig(args.latency_ms, 0, args.error_rate, args.cities), port=args.llama_port).start()
+    climatiq = StubServer('climatiq', StubConfig(args.latency_ms / 5, 0, args.error_rate), port=args.climatiq_port).start()
+    print(f"🧪 Llama stub:    {llama.url}")
+    print(f"🧪 Climatiq stub: {climatiq.url}")
+    print("   Start the backend with LLAMA_API_URL / CLIMATIQ_API_URL pointing here. Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        llama.stop()
+        climatiq.stop()
@@ -0,0 +1,217 @@
+"""
+Fast Path Module
+LLM-free handling of chat messages that simply list cities to visit
+
+Messages like "I want to visit Paris, Amsterdam and Berlin" are recognised
+locally against the bundled city index in data/cities.json. The itinerary,
+route order, transport modes and reply text are built deterministically, so
+/api/chat can skip the Llama round trip. Anything open-ended is escalated.
+"""
+
+import json
+import os
+import re
+import unicodedata
+
+import metrics
+
+CITY_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'cities.json')
+
+# Longest city name or alias, in words
+MAX_NAME_WORDS = 4
+
+# Words that may surround a list of cities without changing its meaning
+FILLER_WORDS = {
+    'i', 'im', 'id', 'we', 'me', 'my', 'our', 'us', 'lets', 'let', 's', 'm', 'd', 'll',
+    'want', 'wanna', 'would', 'like', 'love', 'plan', 'planning', 'create', 'make', 'build',
+    'please', 'can', 'could', 'you', 'help', 'show', 'give',
+    'to', 'go', 'going', 'visit', 'visiting', 'see', 'seeing', 'travel', 'traveling', 'travelling',
+    'trip', 'tour', 'route', 'itinerary', 'journey', 'vacation', 'holiday', 'getaway',
+    'a', 'an', 'the', 'and', 'then', 'also', 'plus', 'after', 'that', 'from', 'via', 'through',
+    'between', 'in', 'of', 'with', 'cities', 'city', 'stops', 'stop',
+    'eco', 'friendly', 'sustainable', 'green', 'low', 'carbon', 'emission', 'emissions',
+}
+
+MAX_TRAIN_KM = 1500
+MAX_BUS_KM = 1200
+MIN_FLIGHT_KM = 300
+
+ECO_TIPS = [
+    "Trains emit up to 90% less CO2 than short-haul flights - book early for the best fares.",
+    "Pack light: every extra kilogram adds to the fuel burned on every leg.",
+    "If you drive, filling every seat cuts the emissions per traveller dramatically.",
+    "Overnight trains save a night's accommodation and a flight's worth of emissions.",
+    "Explore each city on foot, by bike or by public transit once you arrive.",
+]
+
+DECISIONS = metrics.REGISTRY.counter(
+    'ecotrip_fast_path_decisions_total', 'Chat fast-path classifier outcomes', ('result',))
+
+WORD_PATTERN = re.compile(r"[A-Za-z0-9]+")
+
+
+def normalize(text):
+    """Lowercase and strip accents so 'Zürich' and 'zurich' compare equal"""
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+class CityIndex:
+    """Normalized city name and alias lookup loaded once from a JSON file"""
+
+    def __init__(self, path=CITY_INDEX_PATH):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        self.cities = data['cities']
+        self._names = {}
+        for city in self.cities:
+            for name in [city['city']] + city.get('aliases', []):
+                key = tuple(WORD_PATTERN.findall(normalize(name)))
+                # Very short aliases like "LA" or "SF" must be typed in capitals, and
+                # names that double as common words ("Split") must be capitalized
+                if len(name) <= 2:
+                    rule = 'upper'
+                elif city.get('case_sensitive'):
+                    rule = 'capitalized'
+                else:
+                    rule = None
+                self._names.setdefault(key, (city, rule))
+
+    def __len__(self):
+        return len(self.cities)
+
+    def find_cities(self, message):
+        """
+        Scan a message for city names, longest match first.
+
+        Returns (cities, leftover_words): cities in mention order without
+        duplicates, and the normalized words not part of any city name.
+        """
+        original = WORD_PATTERN.findall(unicodedata.normalize('NFKD', message))
+        words = [normalize(w) for w in original]
+        found, leftover = [], []
+        i = 0
+        while i < len(words):
+            for length in range(min(MAX_NAME_WORDS, len(words) - i), 0, -1):
+                match = self._names.get(tuple(words[i:i + length]))
+                if not match:
+                    continue
+                city, rule = match
+                typed = original[i:i + length]
+                if rule == 'upper' and not all(w.isupper() for w in typed):
+                    continue
+                # A capital that opens the message ("Split my trip...") proves nothing
+                if rule == 'capitalized' and (i == 0 or not all(w[:1].isupper() for w in typed)):
+                    continue
+                if city not in found:
+                    found.append(city)
+                i += length
+                break
+            else:
+                leftover.append(words[i])
+                i += 1
+        return found, leftover
+
+
+_index = None
+
+
+def get_index():
+    """Load the bundled city index on first use"""
+    global _index
+    if _index is None:
+        _index = CityIndex()
+        print(f"🏙️ Loaded {len(_index)} cities for the chat fast path")
+    return _index
+
+
+def classify(message, has_itinerary=False):
+    """Return the cities named in a plain city-list message, or None to escalate to the LLM"""
+    if has_itinerary or '?' in message:
+        return None
+    cities, leftover = get_index().find_cities(message)
+    if len(cities) < 2:
+        return None
+    if any(word not in FILLER_WORDS for word in leftover):
+        return None
+    return cities
+
+
+def transport_modes(from_city, to_city, distance_km):
+    """Deterministic transport options between two indexed cities"""
+    same_landmass = from_city['landmass'] == to_city['landmass']
+    modes = []
+    if same_landmass:
+        modes.append('car')
+        if distance_km <= MAX_TRAIN_KM:
+            modes.append('train')
+    if distance_km >= MIN_FLIGHT_KM or not same_landmass:
+        modes.append('flight')
+    if same_landmass and distance_km <= MAX_BUS_KM:
+        modes.append('bus')
+    return modes
+
+
+def build_itinerary(cities, order_route, distance):
+    """
+    Build itinerary data in the same shape the LLM returns.
+
+    order_route orders a list of {name, lat, lng} dicts; distance(lat1, lng1,
+    lat2, lng2) returns kilometres. Both come from app.py.
+    """
+    by_name = {city['name']: city for city in cities}
+    stops = [{'name': c['name'], 'lat': c['lat'], 'lng': c['lng']} for c in cities]
+    ordered = order_route(stops)
+    segments = []
+    for a, b in zip(ordered, ordered[1:]):
+        km = distance(a['lat'], a['lng'], b['lat'], b['lng'])
+        segments.append({
+            'from': a['name'],
+            'to': b['name'],
+            'transport_modes': transport_modes(by_name[a['name']], by_name[b['name']], km)
+        })
+    return {'cities': ordered, 'segments': segments}
+
+
+def render_message(itinerary, mentioned):
+    """Conversational reply text for a fast-path itinerary"""
+    reordered = [c['name'] for c in mentioned] != [c['name'] for c in itinerary['cities']]
+    names = [city['name'].split(',')[0] for city in itinerary['cities']]
+    if len(names) == 2:
+        route = f"Your journey goes from {names[0]} to {names[1]}."
+    else:
+        middle = names[1] if len(names) == 3 else ', '.join(names[1:-2]) + f" and {names[-2]}"
+        route = f"Your journey starts in {names[0]}, continues through {middle} and finishes in {names[-1]}."
+    rail_legs = sum(1 for s in itinerary['segments'] if 'train' in s['transport_modes'])
+
+    lines = [
+        "Great! I've created an eco-friendly itinerary for your trip. Here's what I've planned:",
+        "",
+        route
+    ]
+    if reordered:
+        lines.append("I've optimized the order of your stops to keep total travel distance - and emissions - as low as possible.")
+    if rail_legs == len(itinerary['segments']):
+        lines.append("Every leg can be done by train, one of the lowest-carbon ways to travel. 🚆")
+    elif rail_legs:
+        lines.append(f"{rail_legs} of {len(itinerary['segments'])} legs can be done by train, one of the lowest-carbon ways to travel. 🚆")
+    lines.append("Check the trip summary for the emissions of each transport option.")
+    lines.append("")
+    lines.append(f"💡 **Eco Tip**: {ECO_TIPS[sum(len(n) for n in names) % len(ECO_TIPS)]}")
+    return '\n'.join(lines)
+
+
+def compare_itineraries(fast, llm):
+    """Summarize differences between fast-path and LLM itineraries"""
+    fast_cities = [c['name'] for c in (fast or {}).get('cities', [])]
+    llm_cities = [c.get('name') for c in (llm or {}).get('cities', [])]
+    fast_modes = [sorted(s['transport_modes']) for s in (fast or {}).get('segments', [])]
+    llm_modes = [sorted(s.get('transport_modes', [])) for s in (llm or {}).get('segments', [])]
+    return {
+        'fast_path_cities': fast_cities,
+        'llm_cities': llm_cities,
+        'same_order': fast_cities == llm_cities,
+        'fast_path_modes': fast_modes,
+        'llm_modes': llm_modes,
+        'same_modes': fast_modes == llm_modes
+    }
@@ -1,12 +1,28 @@
 #!/usr/bin/env python3
 """
 HTML Generator Script
-Generates index.html and map.html with the correct API keys from .env file
+Generates index.html and map.html with the correct API keys from .env file,
+writes content-hashed static assets and precompresses everything under public/
 """
 
+import gzip
+import hashlib
 import os
+import re
 from dotenv import load_dotenv
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIR = os.path.join('public', 'static')
+
+# Hex characters of the content hash embedded in asset file names
+HASH_LENGTH = 10
+
+COMPRESSIBLE_EXTENSIONS = {'.html', '.css', '.js', '.json', '.svg', '.txt'}
+
 def load_environment():
     """Load environment variables from .env file"""
     load_dotenv()
@@ -48,74 +64,286 @@ def generate_index_html(google_maps_api_key):
     
     return html_template
 
-def generate_map_html(google_maps_api_key):
-    """Generate map.html with the correct Google Maps API key"""
+# Map stylesheet and script, written to public/static/ under content-hashed names
+MAP_CSS = """body {
+    margin: 0;
+    padding: 0;
+    font-family: Arial, sans-serif;
+    background-color: #f5f5f5;
+}
+
+#map {
+    width: 100%;
+    height: 100vh;
+    background-color: #e8f5e8;
+}
+
+.loading {
+    display: flex;
+    justify-content: center;
+    align-items: center;
+    height: 100vh;
+    font-size: 18px;
+    color: #059669;
+}
+
+.error {
+    display: flex;
+    flex-direction: column;
+    justify-content: center;
+    align-items: center;
+    height: 100vh;
+    padding: 2rem;
+    text-align: center;
+    background-color: #fef2f2;
+    color: #dc2626;
+}
+
+.error h2 {
+    margin-bottom: 1rem;
+}
+
+.error p {
+    margin-bottom: 1rem;
+    color: #64748b;
+}
+
+.retry-btn {
+    padding: 0.5rem 1rem;
+    background: #059669;
+    color: white;
+    border: none;
+    border-radius: 4px;
+    cursor: pointer;
+    font-size: 14px;
+}
+
+.retry-btn:hover {
+    background: #047857;
+}
+"""
+
+MAP_JS = """let map;
+let markers = [];
+let bounds;
+let routeLines = [];
+
+const CARBON_ORDER = ['train', 'bus', 'car', 'flight'];
+
+// Decode a Google encoded polyline (precision 5) into LatLng literals
+function decodePolyline(encoded) {
+    const points = [];
+    let index = 0, lat = 0, lng = 0;
+    while (index < encoded.length) {
+        const deltas = [];
+        for (let i = 0; i < 2; i++) {
+            let shift = 0, value = 0, byte;
+            do {
+                byte = encoded.charCodeAt(index++) - 63;
+                value |= (byte & 0x1f) << shift;
+                shift += 5;
+            } while (byte >= 0x20);
+            deltas.push(value & 1 ? ~(value >> 1) : value >> 1);
+        }
+        lat += deltas[0];
+        lng += deltas[1];
+        points.push({ lat: lat / 1e5, lng: lng / 1e5 });
+    }
+    return points;
+}
+
+// Server-generated line for the lowest-carbon option of a segment, if any
+function segmentPath(segment) {
+    if (!segment || !segment.geometry) return null;
+    const { lines, modes } = segment.geometry;
+    const lineFor = m => modes[m] !== undefined ? lines[modes[m]] : undefined;
+    let mode = null;
+    if (segment.transport_options && segment.transport_options.length > 0) {
+        mode = segment.transport_options.reduce((best, current) =>
+            current.carbon_kg < best.carbon_kg ? current : best
+        ).mode;
+    }
+    if (!mode || !lineFor(mode)) {
+        mode = CARBON_ORDER.find(m => lineFor(m));
+    }
+    return mode ? decodePolyline(lineFor(mode)) : null;
+}
+
+// Initialize the map
+function initMap() {
+    console.log('🗺️ Initializing Google Maps...');
+
+    try {
+        // Create map centered on the United States
+        map = new google.maps.Map(document.getElementById('map'), {
+            center: { lat: 39.8283, lng: -98.5795 },
+            zoom: 4,
+            styles: [
+                {
+                    featureType: 'poi',
+                    elementType: 'labels',
+                    stylers: [{ visibility: 'off' }]
+                }
+            ]
+        });
+
+        bounds = new google.maps.LatLngBounds();
+
+        console.log('✅ Google Maps initialized successfully!');
+
+    } catch (error) {
+        console.error('❌ Error initializing map:', error);
+        showError('Failed to initialize Google Maps. Please check your API key.');
+    }
+}
+
+function showError(message) {
+    const mapDiv = document.getElementById('map');
+    mapDiv.innerHTML = `
+        <div class="error">
+            <h2><i class="fas fa-exclamation-triangle"></i> Map Error</h2>
+            <p>${message}</p>
+            <button class="retry-btn" onclick="location.reload()">
+                <i class="fas fa-redo"></i> Retry
+            </button>
+        </div>
+    `;
+}
+
+// Update markers when destinations change
+function updateMarkers(destinations, segments) {
+    console.log('🔄 Updating markers with destinations:', destinations);
+
+    if (!map || !destinations || destinations.length === 0) {
+        console.log('⚠️ No destinations to display or map not ready');
+        return;
+    }
+
+    try {
+        // Clear existing markers and route line
+        markers.forEach(marker => marker.setMap(null));
+        markers = [];
+        routeLines.forEach(line => line.setMap(null));
+        routeLines = [];
+        bounds = new google.maps.LatLngBounds();
+
+        console.log('🏷️ Adding', destinations.length, 'markers to map');
+
+        const routeCoordinates = [];
+
+        destinations.forEach((destination, index) => {
+            const position = {
+                lat: parseFloat(destination.lat || destination.latitude),
+                lng: parseFloat(destination.lng || destination.longitude)
+            };
+
+            const marker = new google.maps.Marker({
+                position: position,
+                map: map,
+                title: destination.name,
+                label: {
+                    text: (index + 1).toString(),
+                    color: 'white',
+                    fontWeight: 'bold'
+                },
+                icon: {
+                    url: 'data:image/svg+xml;charset=UTF-8,' + encodeURIComponent(`
+                        <svg width="32" height="32" viewBox="0 0 32 32" fill="none" xmlns="http://www.w3.org/2000/svg">
+                            <circle cx="16" cy="16" r="14" fill="#059669" stroke="white" stroke-width="2"/>
+                            <text x="16" y="20" text-anchor="middle" fill="white" font-size="12" font-weight="bold">${index + 1}</text>
+                        </svg>
+                    `),
+                    scaledSize: new google.maps.Size(32, 32),
+                    anchor: new google.maps.Point(16, 16)
+                }
+            });
+
+            // Add click listener
+            marker.addListener('click', () => {
+                console.log('📍 Marker clicked:', destination);
+                window.parent.postMessage({
+                    type: 'marker-clicked',
+                    destination: destination
+                }, '*');
+            });
+
+            markers.push(marker);
+            bounds.extend(position);
+            routeCoordinates.push(position);
+        });
+
+        // Draw one line per leg, using the server's geometry when available
+        for (let i = 0; i + 1 < routeCoordinates.length; i++) {
+            const path = segmentPath(segments && segments[i]);
+            const routeLine = new google.maps.Polyline({
+                path: path || [routeCoordinates[i], routeCoordinates[i + 1]],
+                geodesic: !path,
+                strokeColor: '#059669',
+                strokeOpacity: 0.8,
+                strokeWeight: 3
+            });
+            routeLine.setMap(map);
+            routeLines.push(routeLine);
+        }
+
+        // Fit map to show all markers
+        if (markers.length > 0) {
+            map.fitBounds(bounds);
+
+            // Adjust zoom based on number of markers
+            setTimeout(() => {
+                if (markers.length === 1) {
+                    map.setZoom(12);
+                } else if (markers.length === 2) {
+                    // For 2 markers, ensure reasonable zoom level
+                    const currentZoom = map.getZoom();
+                    if (currentZoom > 8) {
+                        map.setZoom(Math.min(currentZoom, 8));
+                    }
+                } else {
+                    // For 3+ markers, let fitBounds handle it but ensure minimum zoom
+                    const currentZoom = map.getZoom();
+                    if (currentZoom > 6) {
+                        map.setZoom(Math.min(currentZoom, 6));
+                    }
+                }
+            }, 100); // Small delay to let fitBounds complete
+        }
+
+        console.log('✅ Markers updated successfully!');
+
+    } catch (error) {
+        console.error('❌ Error updating markers:', error);
+    }
+}
+
+// Listen for messages from parent window
+window.addEventListener('message', function(event) {
+    if (event.data.type === 'update-markers') {
+        console.log('📨 Received update-markers message:', event.data.destinations);
+        updateMarkers(event.data.destinations, event.data.segments);
+    }
+});
+
+// Initialize map when Google Maps API is loaded
+window.initMap = initMap;
+
+// Check if Google Maps API is already loaded
+if (typeof google !== 'undefined' && google.maps) {
+    initMap();
+}
+"""
+
+def generate_map_html(google_maps_api_key, css_href, js_href):
+    """Generate map.html with the correct Google Maps API key and fingerprinted asset URLs"""
     
-    # Use a different approach to avoid conflicts with CSS curly braces
     html_template = f'''<!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>EcoTrip Map</title>
-    <style>
-        body {{
-            margin: 0;
-            padding: 0;
-            font-family: Arial, sans-serif;
-            background-color: #f5f5f5;
-        }}
-        
-        #map {{
-            width: 100%;
-            height: 100vh;
-            background-color: #e8f5e8;
-        }}
-        
-        .loading {{
-            display: flex;
-            justify-content: center;
-            align-items: center;
-            height: 100vh;
-            font-size: 18px;
-            color: #059669;
-        }}
-        
-        .error {{
-            display: flex;
-            flex-direction: column;
-            justify-content: center;
-            align-items: center;
-            height: 100vh;
-            padding: 2rem;
-            text-align: center;
-            background-color: #fef2f2;
-            color: #dc2626;
-        }}
-        
-        .error h2 {{
-            margin-bottom: 1rem;
-        }}
-        
-        .error p {{
-            margin-bottom: 1rem;
-            color: #64748b;
-        }}
-        
-        .retry-btn {{
-            padding: 0.5rem 1rem;
-            background: #059669;
-            color: white;
-            border: none;
-            border-radius: 4px;
-            cursor: pointer;
-            font-size: 14px;
-        }}
-        
-        .retry-btn:hover {{
-            background: #047857;
-        }}
-    </style>
+    <link rel="stylesheet" href="{css_href}">
 </head>
 <body>
     <div id="map">
@@ -125,176 +353,7 @@ def generate_map_html(google_maps_api_key):
         </div>
     </div>
 
-    <script>
-        let map;
-        let markers = [];
-        let bounds;
-        let routeLine;
-        
-        // Initialize the map
-        function initMap() {{
-            console.log('🗺️ Initializing Google Maps...');
-            
-            try {{
-                // Create map centered on the United States
-                map = new google.maps.Map(document.getElementById('map'), {{
-                    center: {{ lat: 39.8283, lng: -98.5795 }},
-                    zoom: 4,
-                    styles: [
-                        {{
-                            featureType: 'poi',
-                            elementType: 'labels',
-                            stylers: [{{ visibility: 'off' }}]
-                        }}
-                    ]
-                }});
-                
-                bounds = new google.maps.LatLngBounds();
-                
-                console.log('✅ Google Maps initialized successfully!');
-                
-            }} catch (error) {{
-                console.error('❌ Error initializing map:', error);
-                showError('Failed to initialize Google Maps. Please check your API key.');
-            }}
-        }}
-        
-        function showError(message) {{
-            const mapDiv = document.getElementById('map');
-            mapDiv.innerHTML = `
-                <div class="error">
-                    <h2><i class="fas fa-exclamation-triangle"></i> Map Error</h2>
-                    <p>${{message}}</p>
-                    <button class="retry-btn" onclick="location.reload()">
-                        <i class="fas fa-redo"></i> Retry
-                    </button>
-                </div>
-            `;
-        }}
-        
-        // Update markers when destinations change
-        function updateMarkers(destinations) {{
-            console.log('🔄 Updating markers with destinations:', destinations);
-            
-            if (!map || !destinations || destinations.length === 0) {{
-                console.log('⚠️ No destinations to display or map not ready');
-                return;
-            }}
-            
-            try {{
-                // Clear existing markers and route line
-                markers.forEach(marker => marker.setMap(null));
-                markers = [];
-                if (routeLine) {{
-                    routeLine.setMap(null);
-                    routeLine = null;
-                }}
-                bounds = new google.maps.LatLngBounds();
-                
-                console.log('🏷️ Adding', destinations.length, 'markers to map');
-                
-                const routeCoordinates = [];
-                
-                destinations.forEach((destination, index) => {{
-                    const position = {{
-                        lat: parseFloat(destination.lat || destination.latitude),
-                        lng: parseFloat(destination.lng || destination.longitude)
-                    }};
-                    
-                    const marker = new google.maps.Marker({{
-                        position: position,
-                        map: map,
-                        title: destination.name,
-                        label: {{
-                            text: (index + 1).toString(),
-                            color: 'white',
-                            fontWeight: 'bold'
-                        }},
-                        icon: {{
-                            url: 'data:image/svg+xml;charset=UTF-8,' + encodeURIComponent(`
-                                <svg width="32" height="32" viewBox="0 0 32 32" fill="none" xmlns="http://www.w3.org/2000/svg">
-                                    <circle cx="16" cy="16" r="14" fill="#059669" stroke="white" stroke-width="2"/>
-                                    <text x="16" y="20" text-anchor="middle" fill="white" font-size="12" font-weight="bold">${{index + 1}}</text>
-                                </svg>
-                            `),
-                            scaledSize: new google.maps.Size(32, 32),
-                            anchor: new google.maps.Point(16, 16)
-                        }}
-                    }});
-                    
-                    // Add click listener
-                    marker.addListener('click', () => {{
-                        console.log('📍 Marker clicked:', destination);
-                        window.parent.postMessage({{
-                            type: 'marker-clicked',
-                            destination: destination
-                        }}, '*');
-                    }});
-                    
-                    markers.push(marker);
-                    bounds.extend(position);
-                    routeCoordinates.push(position);
-                }});
-                
-                // Draw route line if there are multiple destinations
-                if (routeCoordinates.length > 1) {{
-                    routeLine = new google.maps.Polyline({{
-                        path: routeCoordinates,
-                        geodesic: true,
-                        strokeColor: '#059669',
-                        strokeOpacity: 0.8,
-                        strokeWeight: 3
-                    }});
-                    routeLine.setMap(map);
-                }}
-                
-                // Fit map to show all markers
-                if (markers.length > 0) {{
-                    map.fitBounds(bounds);
-                    
-                    // Adjust zoom based on number of markers
-                    setTimeout(() => {{
-                        if (markers.length === 1) {{
-                            map.setZoom(12);
-                        }} else if (markers.length === 2) {{
-                            // For 2 markers, ensure reasonable zoom level
-                            const currentZoom = map.getZoom();
-                            if (currentZoom > 8) {{
-                                map.setZoom(Math.min(currentZoom, 8));
-                            }}
-                        }} else {{
-                            // For 3+ markers, let fitBounds handle it but ensure minimum zoom
-                            const currentZoom = map.getZoom();
-                            if (currentZoom > 6) {{
-                                map.setZoom(Math.min(currentZoom, 6));
-                            }}
-                        }}
-                    }}, 100); // Small delay to let fitBounds complete
-                }}
-                
-                console.log('✅ Markers updated successfully!');
-                
-            }} catch (error) {{
-                console.error('❌ Error updating markers:', error);
-            }}
-        }}
-        
-        // Listen for messages from parent window
-        window.addEventListener('message', function(event) {{
-            if (event.data.type === 'update-markers') {{
-                console.log('📨 Received update-markers message:', event.data.destinations);
-                updateMarkers(event.data.destinations);
-            }}
-        }});
-        
-        // Initialize map when Google Maps API is loaded
-        window.initMap = initMap;
-        
-        // Check if Google Maps API is already loaded
-        if (typeof google !== 'undefined' && google.maps) {{
-            initMap();
-        }}
-    </script>
+    <script src="{js_href}"></script>
     
     <!-- Google Maps API -->
     <script
@@ -307,6 +366,62 @@ def generate_map_html(google_maps_api_key):
     
     return html_template
 
+def write_if_changed(path, content):
+    """Write a text file only if its content differs, returning True if written"""
+    data = content.encode('utf-8')
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            if f.read() == data:
+                return False
+    with open(path, 'wb') as f:
+        f.write(data)
+    return True
+
+def write_hashed_asset(directory, stem, extension, content):
+    """Write content as stem.<hash>.extension, removing older versions; returns the file name"""
+    digest = hashlib.sha256(content.encode('utf-8')).hexdigest()[:HASH_LENGTH]
+    filename = f"{stem}.{digest}.{extension}"
+    
+    # Drop stale fingerprints (and their compressed variants) of the same asset
+    stale_pattern = re.compile(rf'^{re.escape(stem)}\.[0-9a-f]{{{HASH_LENGTH}}}\.{re.escape(extension)}(\.gz|\.br)?$')
+    for existing in os.listdir(directory):
+        if stale_pattern.match(existing) and not existing.startswith(filename):
+            os.remove(os.path.join(directory, existing))
+    
+    write_if_changed(os.path.join(directory, filename), content)
+    return filename
+
+def precompress(directory):
+    """Write .gz (and .br when brotli is installed) next to every compressible file"""
+    written = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            if os.path.splitext(name)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+                continue
+            with open(path, 'rb') as f:
+                data = f.read()
+            
+            variants = [('.gz', lambda d: gzip.compress(d, compresslevel=9, mtime=0))]
+            if brotli is not None:
+                variants.append(('.br', lambda d: brotli.compress(d, quality=11)))
+            
+            for suffix, compress in variants:
+                target = path + suffix
+                # Skip variants that are already up to date
+                if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+                    continue
+                with open(target, 'wb') as f:
+                    f.write(compress(data))
+                written += 1
+    return written
+
+def report_write(path, written):
+    if written:
+        print(f"✅ Generated {path}")
+    else:
+        print(f"⏭️  {path} unchanged, skipped")
+
 def main():
     """Main function to generate HTML files"""
     print("🔧 Generating HTML files with API keys...")
@@ -315,8 +430,7 @@ def main():
     env_vars = load_environment()
     
     # Create vacation-chatbot/public directory if it doesn't exist
-    import os
-    os.makedirs('public', exist_ok=True)
+    os.makedirs(STATIC_DIR, exist_ok=True)
     
     # Check if Google Maps API key is available
     if not env_vars['GOOGLE_MAPS_API_KEY']:
@@ -328,19 +442,23 @@ def main():
     index_html = generate_index_html(env_vars['GOOGLE_MAPS_API_KEY'])
     
     # Write index.html
-    with open('public/index.html', 'w', encoding='utf-8') as f:
-        f.write(index_html)
+    report_write('public/index.html', write_if_changed('public/index.html', index_html))
     
-    print("✅ Generated public/index.html")
+    # Write fingerprinted map assets, then map.html pointing at them
+    css_name = write_hashed_asset(STATIC_DIR, 'map', 'css', MAP_CSS)
+    js_name = write_hashed_asset(STATIC_DIR, 'map', 'js', MAP_JS)
+    print(f"✅ Fingerprinted assets: static/{css_name}, static/{js_name}")
     
     # Generate map.html
-    map_html = generate_map_html(env_vars['GOOGLE_MAPS_API_KEY'])
+    map_html = generate_map_html(env_vars['GOOGLE_MAPS_API_KEY'], f'/static/{css_name}', f'/static/{js_name}')
     
     # Write map.html
-    with open('public/map.html', 'w', encoding='utf-8') as f:
-        f.write(map_html)
+    report_write('public/map.html', write_if_changed('public/map.html', map_html))
     
-    print("✅ Generated public/map.html")
+    # Precompress everything under public/ for the static file server
+    compressed = precompress('public')
+    encodings = 'gzip and brotli' if brotli is not None else 'gzip (pip install brotli for .br)'
+    print(f"✅ Precompressed {compressed} file variants with {encodings}")
     
     # Summary
     print("\n📋 Summary:")
@@ -0,0 +1,309 @@
+"""
+Geometry Module
+Server-side route lines for the map, simplified and encoded as polylines
+
+Flights follow the great circle between two cities. Ground modes follow a
+road or rail graph when one is registered for the mode (see load_graphs),
+and otherwise fall back to the great circle as well. Every line is
+simplified with Douglas-Peucker to what is visible at the target zoom level,
+encoded in the Google encoded-polyline format, and cached per city pair.
+Modes that share a line (by default all of them) share one encoded string.
+
+Graph files are JSON, one per network, in GEOMETRY_GRAPH_DIR:
+
+    {"modes": ["train"], "nodes": [[lat, lng], ...], "edges": [[0, 1], [1, 2], ...]}
+
+Configure with environment variables:
+    GEOMETRY_GRAPH_DIR   = directory of graph files (default: data/graphs)
+    GEOMETRY_ZOOM        = default map zoom the lines are simplified for (default: 6)
+    GEOMETRY_CACHE_SIZE  = cached city-pair lines (default: 4096)
+"""
+
+import glob
+import heapq
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
+
+import metrics
+import spatial
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+GEOMETRY_GRAPH_DIR = os.getenv('GEOMETRY_GRAPH_DIR', os.path.join(DATA_DIR, 'graphs'))
+GEOMETRY_ZOOM = int(os.getenv('GEOMETRY_ZOOM', '6'))
+GEOMETRY_CACHE_SIZE = int(os.getenv('GEOMETRY_CACHE_SIZE', '4096'))
+
+# Ground width of one map pixel at the equator at zoom 0, in km
+KM_PER_PIXEL_ZOOM_0 = 156.543
+
+# Spacing of interpolated great-circle points before simplification
+GREAT_CIRCLE_STEP_KM = 25
+
+# Source name of lines that are not routed over a graph
+GREAT_CIRCLE = 'great_circle'
+
+# How far a city may be from the nearest graph node to route over the graph
+SNAP_KM = 50
+
+KM_PER_DEGREE_LAT = 110.574
+KM_PER_DEGREE_LNG = 111.320
+
+
+def tolerance_km(zoom):
+    """Simplification tolerance: about one pixel at this zoom level"""
+    return KM_PER_PIXEL_ZOOM_0 / (2 ** zoom)
+
+
+def great_circle_points(lat1, lng1, lat2, lng2, step_km=GREAT_CIRCLE_STEP_KM):
+    """Points every step_km along the great circle between two coordinates"""
+    a = spatial.to_unit_vector(lat1, lng1)
+    b = spatial.to_unit_vector(lat2, lng2)
+    dot = max(-1.0, min(1.0, sum(x * y for x, y in zip(a, b))))
+    angle = math.acos(dot)
+    steps = max(1, math.ceil(angle * spatial.EARTH_RADIUS_KM / step_km))
+    if angle < 1e-9 or math.sin(angle) < 1e-9:
+        # Same point, or antipodes where the great circle is undefined
+        return [(lat1, lng1), (lat2, lng2)]
+
+    points = []
+    for step in range(steps + 1):
+        t = step / steps
+        wa = math.sin((1 - t) * angle) / math.sin(angle)
+        wb = math.sin(t * angle) / math.sin(angle)
+        x, y, z = (wa * p + wb * q for p, q in zip(a, b))
+        points.append((math.degrees(math.atan2(z, math.hypot(x, y))), math.degrees(math.atan2(y, x))))
+    # Keep the endpoints exact
+    points[0], points[-1] = (lat1, lng1), (lat2, lng2)
+    return points
+
+
+def simplify(points, tolerance):
+    """Douglas-Peucker simplification; tolerance is in km"""
+    if len(points) < 3:
+        return list(points)
+
+    # Local equirectangular projection to km around the line's mean latitude
+    scale = KM_PER_DEGREE_LNG * math.cos(math.radians(sum(p[0] for p in points) / len(points)))
+    projected = []
+    previous_lng = points[0][1]
+    unwrapped = 0.0
+    for lat, lng in points:
+        # Unwrap longitudes so lines crossing the antimeridian stay continuous
+        delta = lng - previous_lng
+        if delta > 180:
+            unwrapped -= 360
+        elif delta < -180:
+            unwrapped += 360
+        previous_lng = lng
+        projected.append(((lng + unwrapped) * scale, lat * KM_PER_DEGREE_LAT))
+
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        (x1, y1), (x2, y2) = projected[first], projected[last]
+        dx, dy = x2 - x1, y2 - y1
+        length = math.hypot(dx, dy)
+        farthest, max_distance = None, tolerance
+        for i in range(first + 1, last):
+            px, py = projected[i]
+            if length == 0:
+                distance = math.hypot(px - x1, py - y1)
+            else:
+                distance = abs(dy * px - dx * py + x2 * y1 - y2 * x1) / length
+            if distance > max_distance:
+                farthest, max_distance = i, distance
+        if farthest is not None:
+            keep[farthest] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def encode_polyline(points, precision=5):
+    """Google encoded-polyline string for a list of (lat, lng)"""
+    factor = 10 ** precision
+    result = []
+    previous_lat = previous_lng = 0
+    for lat, lng in points:
+        lat_e5, lng_e5 = round(lat * factor), round(lng * factor)
+        for delta in (lat_e5 - previous_lat, lng_e5 - previous_lng):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                result.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            result.append(chr(value + 63))
+        previous_lat, previous_lng = lat_e5, lng_e5
+    return ''.join(result)
+
+
+def decode_polyline(encoded, precision=5):
+    """Inverse of encode_polyline"""
+    factor = 10 ** precision
+    points, index, lat, lng = [], 0, 0, 0
+    while index < len(encoded):
+        deltas = []
+        for _ in range(2):
+            shift = value = 0
+            while True:
+                byte = ord(encoded[index]) - 63
+                index += 1
+                value |= (byte & 0x1f) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(value >> 1) if value & 1 else value >> 1)
+        lat += deltas[0]
+        lng += deltas[1]
+        points.append((lat / factor, lng / factor))
+    return points
+
+
+class GroundGraph:
+    """Road or rail network; routes between cities follow its shortest paths"""
+
+    def __init__(self, name, nodes, edges):
+        self.name = name
+        self.nodes = [tuple(node) for node in nodes]
+        self.adjacency = [[] for _ in self.nodes]
+        for a, b in edges:
+            (lat1, lng1), (lat2, lng2) = self.nodes[a], self.nodes[b]
+            km = spatial.chord_to_km(sum((p - q) ** 2 for p, q in zip(
+                spatial.to_unit_vector(lat1, lng1), spatial.to_unit_vector(lat2, lng2))))
+            self.adjacency[a].append((b, km))
+            self.adjacency[b].append((a, km))
+        self.index = spatial.SpatialIndex(self.nodes)
+
+    def route(self, lat1, lng1, lat2, lng2):
+        """Points along the shortest path between two coordinates, or None if unreachable"""
+        start = self.index.nearest(lat1, lng1, k=1, max_km=SNAP_KM)
+        end = self.index.nearest(lat2, lng2, k=1, max_km=SNAP_KM)
+        if not start or not end:
+            return None
+        source, target = start[0][1], end[0][1]
+
+        distances = {source: 0.0}
+        previous = {}
+        queue = [(0.0, source)]
+        while queue:
+            distance, node = heapq.heappop(queue)
+            if node == target:
+                break
+            if distance > distances.get(node, math.inf):
+                continue
+            for neighbour, km in self.adjacency[node]:
+                candidate = distance + km
+                if candidate < distances.get(neighbour, math.inf):
+                    distances[neighbour] = candidate
+                    previous[neighbour] = node
+                    heapq.heappush(queue, (candidate, neighbour))
+        if target not in distances:
+            return None
+
+        path = [target]
+        while path[-1] != source:
+            path.append(previous[path[-1]])
+        path.reverse()
+        return [(lat1, lng1)] + [self.nodes[i] for i in path] + [(lat2, lng2)]
+
+
+# mode -> GroundGraph
+GRAPHS = {}
+_graphs_loaded = False
+_graphs_lock = threading.Lock()
+
+
+def register_graph(modes, graph):
+    """Route the given ground modes over `graph`"""
+    for mode in modes:
+        GRAPHS[mode] = graph
+
+
+def load_graphs(directory=GEOMETRY_GRAPH_DIR):
+    """Register every graph file in `directory` (once)"""
+    global _graphs_loaded
+    with _graphs_lock:
+        if _graphs_loaded:
+            return
+        _graphs_loaded = True
+        for path in sorted(glob.glob(os.path.join(directory, '*.json'))):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    data = json.load(f)
+                name = os.path.splitext(os.path.basename(path))[0]
+                register_graph(data['modes'], GroundGraph(name, data['nodes'], data['edges']))
+                print(f"🛤️ Loaded {name} graph ({len(data['nodes'])} nodes) for {', '.join(data['modes'])}")
+            except (OSError, ValueError, KeyError, IndexError) as e:
+                print(f"Error loading route graph {path}: {e}")
+
+
+class _LineCache:
+    def __init__(self, size):
+        self.size = size
+        self._lines = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            line = self._lines.get(key)
+            if line is not None:
+                self._lines.move_to_end(key)
+        metrics.record_cache_lookup('geometry', line is not None)
+        return line
+
+    def put(self, key, line):
+        with self._lock:
+            self._lines[key] = line
+            self._lines.move_to_end(key)
+            while len(self._lines) > self.size:
+                self._lines.popitem(last=False)
+
+
+_cache = _LineCache(GEOMETRY_CACHE_SIZE)
+
+
+def segment_line(from_city, to_city, mode, zoom=GEOMETRY_ZOOM):
+    """(source, points) for one leg by one mode; source is the graph name or 'great_circle'"""
+    load_graphs()
+    graph = GRAPHS.get(mode) if mode != 'flight' else None
+    a = (round(from_city['lat'], 4), round(from_city['lng'], 4))
+    b = (round(to_city['lat'], 4), round(to_city['lng'], 4))
+    # Lines are symmetric, so A->B and B->A share one cache entry
+    reverse = b < a
+    key = (graph.name if graph else GREAT_CIRCLE, min(a, b), max(a, b), zoom)
+
+    cached = _cache.get(key)
+    if cached is None:
+        start, end = key[1], key[2]
+        points = graph.route(*start, *end) if graph else None
+        source = graph.name if points is not None else GREAT_CIRCLE
+        if points is None:
+            points = great_circle_points(*start, *end)
+        cached = (source, simplify(points, tolerance_km(zoom)))
+        _cache.put(key, cached)
+    source, line = cached
+    return source, line[::-1] if reverse else line
+
+
+def segment_points(from_city, to_city, mode, zoom=GEOMETRY_ZOOM):
+    """Simplified (lat, lng) points for one leg by one mode"""
+    return segment_line(from_city, to_city, mode, zoom)[1]
+
+
+def segment_geometry(from_city, to_city, modes, zoom=GEOMETRY_ZOOM):
+    """
+    Map lines for one leg, each distinct line encoded once.
+
+    Returns {'lines': {source: polyline}, 'modes': {mode: source}}; modes
+    without their own graph all share the 'great_circle' line.
+    """
+    lines, by_mode = {}, {}
+    for mode in modes:
+        source, points = segment_line(from_city, to_city, mode, zoom)
+        if source not in lines:
+            lines[source] = encode_polyline(points)
+        by_mode[mode] = source
+    return {'lines': lines, 'modes': by_mode}
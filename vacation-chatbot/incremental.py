@@ -0,0 +1,128 @@
+"""
+Incremental Module
+Reuse of unchanged itinerary segments when a conversation edits a trip
+
+The front end sends the current trip (including its processed segments) as
+trip_context. When the LLM returns an edited itinerary, legs whose endpoints
+(names and coordinates) and transport modes are unchanged keep their previous
+transport options, and only new or changed legs go through emissions again.
+Direct distance and map geometry are cheap and cached, so they are always
+recomputed rather than taken from the client.
+The response includes a segment delta, and clients that send
+segment_delta_only receive only the recomputed segments, patching the rest
+from their own copy.
+"""
+
+import numbers
+
+import metrics
+from structured_output import TRANSPORT_MODES
+
+SEGMENTS = metrics.REGISTRY.counter(
+    'ecotrip_itinerary_segments_total', 'Itinerary segments reused from the previous trip or recomputed', ('result',))
+
+OPTION_NUMBERS = ('distance_km', 'duration_hours', 'carbon_kg')
+
+# How far (in degrees, about 100 m) an endpoint may move and still count as the same place
+COORD_TOLERANCE_DEG = 0.001
+
+
+def segment_key(from_name, to_name):
+    """Identity of a leg: its endpoint names, case- and whitespace-insensitive"""
+    return (' '.join(str(from_name).lower().split()), ' '.join(str(to_name).lower().split()))
+
+
+def _valid_segment(segment):
+    if not isinstance(segment, dict) or not isinstance(segment.get('transport_options'), list):
+        return False
+    if 'from' not in segment or 'to' not in segment:
+        return False
+    for coords in (segment.get('from_coords'), segment.get('to_coords')):
+        if not isinstance(coords, dict) or not all(isinstance(coords.get(k), numbers.Real) for k in ('lat', 'lng')):
+            return False
+    for option in segment['transport_options']:
+        if not isinstance(option, dict) or option.get('mode') not in TRANSPORT_MODES:
+            return False
+        if not all(isinstance(option.get(field), numbers.Real) for field in OPTION_NUMBERS):
+            return False
+    return True
+
+
+def previous_segments(trip_context):
+    """Segments of the previous trip in trip_context, with None in place of malformed ones"""
+    segments = (trip_context or {}).get('segments') or []
+    if not isinstance(segments, list):
+        return []
+    # Keep positions so delta indexes match the client's tripData.segments
+    return [segment if _valid_segment(segment) else None for segment in segments]
+
+
+class SegmentIndex:
+    """Previous segments by leg, for O(1) reuse lookups"""
+
+    def __init__(self, segments):
+        self._segments = {}
+        for old_index, segment in enumerate(segments):
+            if segment is None:
+                continue
+            self._segments.setdefault(segment_key(segment['from'], segment['to']), (old_index, segment))
+
+    def __len__(self):
+        return len(self._segments)
+
+    def reusable(self, from_city, to_city, modes):
+        """(old_index, segment) for this leg if its coordinates and modes are unchanged, else None"""
+        match = self._segments.get(segment_key(from_city['name'], to_city['name']))
+        if match is None:
+            return None
+        _, segment = match
+        if not (_same_place(segment['from_coords'], from_city) and _same_place(segment['to_coords'], to_city)):
+            return None
+        if sorted(option['mode'] for option in segment['transport_options']) != sorted(modes):
+            return None
+        return match
+
+
+def _same_place(coords, city):
+    return (abs(coords['lat'] - city['lat']) <= COORD_TOLERANCE_DEG
+            and abs(coords['lng'] - city['lng']) <= COORD_TOLERANCE_DEG)
+
+
+def reuse_segment(previous, from_city, to_city, direct_distance_km, geometry):
+    """Previous transport options under the new itinerary's cities, distance and geometry"""
+    return {
+        'from': from_city['name'],
+        'to': to_city['name'],
+        'from_coords': {'lat': from_city['lat'], 'lng': from_city['lng']},
+        'to_coords': {'lat': to_city['lat'], 'lng': to_city['lng']},
+        'direct_distance_km': direct_distance_km,
+        'transport_options': [dict(option) for option in previous['transport_options']],
+        'geometry': geometry
+    }
+
+
+def segment_delta(old_segments, new_segments, reused):
+    """
+    Patch that turns the previous tripData.segments into the new ones.
+
+    reused lists (new_index, old_index) pairs: new segment new_index is the
+    client's old segment old_index. computed lists the new indexes that were
+    recalculated, and removed the old indexes no longer used.
+    """
+    reused_new = {new_index for new_index, _ in reused}
+    used_old = {old_index for _, old_index in reused}
+    delta = {
+        'segment_count': len(new_segments),
+        'reused': [list(pair) for pair in reused],
+        'computed': [i for i in range(len(new_segments)) if i not in reused_new],
+        'removed': [i for i in range(len(old_segments)) if i not in used_old]
+    }
+    SEGMENTS.inc(len(reused), result='reused')
+    SEGMENTS.inc(len(delta['computed']), result='computed')
+    return delta
+
+
+def strip_reused(segments, delta):
+    """Segments with reused positions set to None, for clients that patch their own copy"""
+    reused_new = {new_index for new_index, _ in delta['reused']}
+    return [None if i in reused_new else segment for i, segment in enumerate(segments)]
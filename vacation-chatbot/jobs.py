@@ -0,0 +1,230 @@
+"""
+Jobs Module
+Background job queue for CPU-heavy route optimization and scoring
+
+Jobs run in a process pool, so large optimizations use other cores instead
+of holding a Flask worker (and the GIL) for their whole duration. A job's id
+is a hash of its kind and parameters, so identical submissions share one job.
+Finished jobs are kept for JOB_RESULT_TTL seconds. Queued jobs can be
+cancelled; a job that is already running finishes, but its result is
+discarded.
+
+Configure with environment variables:
+    JOB_EXECUTOR      = 'process' (default) or 'thread'
+    JOB_WORKERS       = pool size (default: CPU count, at most 4)
+    JOB_MAX_PENDING   = queued plus running jobs before submissions are rejected (default: 64)
+    JOB_RESULT_TTL    = seconds finished jobs and their results are kept (default: 600)
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import threading
+import time
+from concurrent.futures import CancelledError, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+import metrics
+
+JOB_EXECUTOR = os.getenv('JOB_EXECUTOR', 'process').lower()
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', str(min(4, os.cpu_count() or 1))))
+JOB_MAX_PENDING = int(os.getenv('JOB_MAX_PENDING', '64'))
+JOB_RESULT_TTL = float(os.getenv('JOB_RESULT_TTL', '600'))
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATUSES = {SUCCEEDED, FAILED, CANCELLED}
+
+JOBS_SUBMITTED = metrics.REGISTRY.counter(
+    'ecotrip_jobs_submitted_total', 'Job submissions by outcome', ('kind', 'result'))
+JOBS_FINISHED = metrics.REGISTRY.counter(
+    'ecotrip_jobs_finished_total', 'Finished jobs by final status', ('kind', 'status'))
+JOB_DURATION = metrics.REGISTRY.histogram(
+    'ecotrip_job_duration_seconds', 'Time from submission to completion', ('kind',))
+JOBS_PENDING = metrics.REGISTRY.gauge(
+    'ecotrip_jobs_pending', 'Queued and running jobs')
+
+# kind -> top-level function called as func(**params) in a worker process
+JOB_KINDS = {}
+
+
+def register(kind, func):
+    """Make `func` (a picklable module-level function) available as job kind `kind`"""
+    JOB_KINDS[kind] = func
+
+
+class QueueFull(Exception):
+    """Raised when too many jobs are pending; carries a Retry-After hint in seconds"""
+
+    def __init__(self, retry_after):
+        super().__init__('Too many pending jobs')
+        self.retry_after = retry_after
+
+
+def job_id_for(kind, params):
+    """Stable id for a kind and its parameters, independent of key order"""
+    canonical = json.dumps([kind, params], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:24]
+
+
+class Job:
+    def __init__(self, job_id, kind):
+        self.id = job_id
+        self.kind = kind
+        self.status = QUEUED
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.future = None
+
+    def refresh(self):
+        future = self.future
+        if self.status == QUEUED and future is not None and future.running():
+            self.status = RUNNING
+
+    def to_dict(self):
+        self.refresh()
+        info = {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'submitted_at': datetime.fromtimestamp(self.submitted_at).isoformat()
+        }
+        if self.finished_at is not None:
+            info['finished_at'] = datetime.fromtimestamp(self.finished_at).isoformat()
+            info['duration_ms'] = round((self.finished_at - self.submitted_at) * 1000, 1)
+            info['expires_at'] = datetime.fromtimestamp(self.finished_at + JOB_RESULT_TTL).isoformat()
+        if self.error:
+            info['error'] = self.error
+        return info
+
+
+class JobManager:
+    """Submits jobs to a worker pool and tracks them until their results expire"""
+
+    def __init__(self, executor=JOB_EXECUTOR, workers=JOB_WORKERS,
+                 max_pending=JOB_MAX_PENDING, ttl=JOB_RESULT_TTL):
+        self.executor_type = executor
+        self.workers = workers
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self._jobs = {}
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        if self._pool is None:
+            if self.executor_type == 'thread':
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='job')
+            else:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            print(f"🧵 Started {self.executor_type} pool with {self.workers} workers for background jobs")
+        return self._pool
+
+    def submit(self, kind, params):
+        """Return (job, created); an identical live job is returned instead of starting a new one"""
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind '{kind}'. Available: {', '.join(sorted(JOB_KINDS))}")
+        try:
+            inspect.signature(JOB_KINDS[kind]).bind(**params)
+        except TypeError as e:
+            raise ValueError(f"Invalid params for '{kind}': {e}")
+        job_id = job_id_for(kind, params)
+        with self._lock:
+            self._sweep_locked()
+            existing = self._jobs.get(job_id)
+            if existing and existing.status not in (FAILED, CANCELLED):
+                JOBS_SUBMITTED.inc(kind=kind, result='deduplicated')
+                return existing, False
+
+            if self._pending_locked() >= self.max_pending:
+                JOBS_SUBMITTED.inc(kind=kind, result='rejected')
+                raise QueueFull(retry_after=max(1, int(self._pending_locked() / max(1, self.workers))))
+
+            job = Job(job_id, kind)
+            try:
+                job.future = self._get_pool().submit(JOB_KINDS[kind], **params)
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for memory); start a fresh pool
+                self._pool = None
+                job.future = self._get_pool().submit(JOB_KINDS[kind], **params)
+            self._jobs[job_id] = job
+            JOBS_SUBMITTED.inc(kind=kind, result='created')
+            JOBS_PENDING.set(self._pending_locked())
+
+        job.future.add_done_callback(lambda future: self._finish(job, future))
+        return job, True
+
+    def get(self, job_id):
+        """The job with this id, or None if it is unknown or expired"""
+        with self._lock:
+            self._sweep_locked()
+            job = self._jobs.get(job_id)
+        if job:
+            job.refresh()
+        return job
+
+    def cancel(self, job_id):
+        """Cancel a job; returns the job, or None if it is unknown or expired"""
+        job = self.get(job_id)
+        if job is None or job.status in FINISHED_STATUSES:
+            return job
+        # Queued jobs never start; running ones finish in the worker but their result is dropped
+        future = job.future
+        if future is not None:
+            future.cancel()
+        with self._lock:
+            if job.status not in FINISHED_STATUSES:
+                self._mark_finished_locked(job, CANCELLED)
+        return job
+
+    def _finish(self, job, future):
+        with self._lock:
+            if job.status in FINISHED_STATUSES:
+                return
+            try:
+                job.result = future.result()
+                status = SUCCEEDED
+            except CancelledError:
+                status = CANCELLED
+            except Exception as e:
+                job.error = f"{type(e).__name__}: {e}"
+                status = FAILED
+            self._mark_finished_locked(job, status)
+        if job.status == FAILED:
+            print(f"Job {job.id} ({job.kind}) failed: {job.error}")
+
+    def _mark_finished_locked(self, job, status):
+        job.status = status
+        job.finished_at = time.time()
+        job.future = None
+        JOBS_FINISHED.inc(kind=job.kind, status=status)
+        JOB_DURATION.observe(job.finished_at - job.submitted_at, kind=job.kind)
+        JOBS_PENDING.set(self._pending_locked())
+
+    def _pending_locked(self):
+        return sum(1 for job in self._jobs.values() if job.status not in FINISHED_STATUSES)
+
+    def _sweep_locked(self):
+        cutoff = time.time() - self.ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at is not None and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def snapshot(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                job.refresh()
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return {'executor': self.executor_type, 'workers': self.workers, 'jobs': counts}
+
+
+JOBS = JobManager()
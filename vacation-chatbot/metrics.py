@@ -0,0 +1,224 @@
+"""
+Metrics Module
+Lightweight Prometheus-style counters, gauges and histograms for the Flask backend
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, tuned for LLM round trips down to in-process work
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(label_names, label_values, extra=None):
+    """Render a Prometheus label set like {stage="llm_call"}"""
+    pairs = list(zip(label_names, label_values))
+    if extra:
+        pairs.extend(extra)
+    if not pairs:
+        return ''
+    rendered = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for name, value in pairs
+    )
+    return '{' + rendered + '}'
+
+
+class _Metric:
+    """Base class holding one value per label combination"""
+
+    metric_type = 'untyped'
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def render(self):
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.metric_type}'
+        ]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value):
+        return [f'{self.name}{_format_labels(self.label_names, key)} {value}']
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    metric_type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+
+    metric_type = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    """Cumulative bucketed distribution of observed values"""
+
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (non-cumulative), then sum and count
+                state = [[0] * len(self.buckets), 0.0, 0]
+                self._values[key] = state
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall-clock duration of the wrapped block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state[2] if state else 0
+
+    def _render_value(self, key, value):
+        bucket_counts, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, bucket_counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.label_names, key, [('le', bound)])
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        labels = _format_labels(self.label_names, key, [('le', '+Inf')])
+        lines.append(f'{self.name}_bucket{labels} {count}')
+        labels = _format_labels(self.label_names, key)
+        lines.append(f'{self.name}_sum{labels} {total}')
+        lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class Registry:
+    """Collection of metrics rendered together on /metrics"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, label_names=()):
+        return self._register(Counter(name, documentation, label_names))
+
+    def gauge(self, name, documentation, label_names=()):
+        return self._register(Gauge(name, documentation, label_names))
+
+    def histogram(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, label_names, buckets))
+
+    def render(self):
+        """Render all metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# HTTP-level metrics
+HTTP_REQUESTS = REGISTRY.counter(
+    'ecotrip_http_requests_total', 'HTTP requests handled', ('endpoint', 'method', 'status'))
+HTTP_LATENCY = REGISTRY.histogram(
+    'ecotrip_http_request_duration_seconds', 'HTTP request latency', ('endpoint', 'method'))
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    'ecotrip_http_requests_in_flight', 'HTTP requests currently being handled', ('endpoint',))
+
+# Per-stage latency inside /api/chat
+CHAT_STAGE_LATENCY = REGISTRY.histogram(
+    'ecotrip_chat_stage_duration_seconds', 'Latency of each /api/chat pipeline stage', ('stage',))
+
+# Outbound calls to the Llama and Climatiq APIs
+UPSTREAM_REQUESTS = REGISTRY.counter(
+    'ecotrip_upstream_requests_total', 'Outbound HTTP calls per upstream host', ('host', 'status'))
+UPSTREAM_ERRORS = REGISTRY.counter(
+    'ecotrip_upstream_errors_total', 'Failed outbound HTTP calls per upstream host', ('host', 'reason'))
+UPSTREAM_LATENCY = REGISTRY.histogram(
+    'ecotrip_upstream_request_duration_seconds', 'Outbound HTTP call latency per upstream host', ('host',))
+UPSTREAM_IN_FLIGHT = REGISTRY.gauge(
+    'ecotrip_upstream_requests_in_flight', 'Outbound HTTP calls currently waiting on a response', ('host',))
+
+# Cache effectiveness, labelled by cache name and hit/miss
+CACHE_LOOKUPS = REGISTRY.counter(
+    'ecotrip_cache_lookups_total', 'Cache lookups by cache and result', ('cache', 'result'))
+
+# Emissions lookups that fell back to static CARBON_FACTORS
+EMISSIONS_FALLBACKS = REGISTRY.counter(
+    'ecotrip_emissions_fallbacks_total', 'Emissions lookups answered from static factors', ('mode',))
+
+
+def time_stage(stage):
+    """Context manager timing one /api/chat pipeline stage"""
+    return CHAT_STAGE_LATENCY.time(stage=stage)
+
+
+def record_cache_lookup(cache, hit):
+    """Count a cache hit or miss for the named cache"""
+    CACHE_LOOKUPS.inc(cache=cache, result='hit' if hit else 'miss')
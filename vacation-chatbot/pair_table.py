@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Pair Table Module
+Prebuilt city-pair distance and emissions table, memory-mapped at runtime
+
+Build once (the output is shared by every worker through the page cache):
+    python pair_table.py                        # static emission factors
+    python pair_table.py --emissions climatiq   # per-km factors fetched from Climatiq
+
+The file holds a small JSON header (modes and [name, lat, lng] per city id)
+followed by a little-endian float32 matrix of shape cities x cities x
+(1 + modes). Slot 0 is the great-circle distance in km, and slot 1 + m is the
+kg CO2 for one traveller by mode m over that mode's routed distance. At
+runtime the matrix is memory-mapped and read in place, so loading costs
+nothing beyond the header.
+
+Configure with environment variables:
+    PAIR_TABLE_FILE      = table path (default: data/pair_table.bin)
+    PAIR_TABLE_MATCH_KM  = how close a city must be to a table city to use it (default: 1)
+
+A city with a different position still uses the table when its name matches
+a table city within NAME_MATCH_KM; anything else is computed live, so nearby
+but distinct places (Paris and Saint-Denis) never collapse onto one entry.
+"""
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+
+import metrics
+import spatial
+
+MAGIC = b'ECOPAIR1'
+HEADER_LENGTH = struct.Struct('<I')
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+PAIR_TABLE_FILE = os.getenv('PAIR_TABLE_FILE', os.path.join(DATA_DIR, 'pair_table.bin'))
+PAIR_TABLE_MATCH_KM = float(os.getenv('PAIR_TABLE_MATCH_KM', '1'))
+
+# Sanity bound on name matches, so a mislabelled city never maps across the map
+NAME_MATCH_KM = 50
+
+
+def normalize_name(name):
+    return ' '.join(str(name).lower().split())
+
+
+class PairTable:
+    """Read-only view of a built table; values come straight from the mapped pages"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'{path} is not a pair table')
+        if sys.byteorder != 'little':
+            raise ValueError('pair tables are little-endian')
+        offset = len(MAGIC)
+        (header_length,) = HEADER_LENGTH.unpack_from(self._mmap, offset)
+        offset += HEADER_LENGTH.size
+        header = json.loads(self._mmap[offset:offset + header_length])
+        offset += header_length
+
+        self.modes = header['modes']
+        self.cities = [{'name': name, 'lat': lat, 'lng': lng} for name, lat, lng in header['cities']]
+        self._mode_slots = {mode: 1 + m for m, mode in enumerate(self.modes)}
+        self._stride = 1 + len(self.modes)
+        self._row = len(self.cities) * self._stride
+        self._values = memoryview(self._mmap)[offset:].cast('f')
+        self._index = spatial.SpatialIndex.from_items(self.cities)
+        self._names = {}
+        for city_id, city in enumerate(self.cities):
+            self._names.setdefault(normalize_name(city['name']), city_id)
+
+    def __len__(self):
+        return len(self.cities)
+
+    def city_id(self, lat, lng, name=None, max_km=PAIR_TABLE_MATCH_KM):
+        """Id of the table city at these coordinates (or with this name nearby), else None"""
+        match = self._index.nearest(lat, lng, k=1, max_km=max_km)
+        if match:
+            return match[0][1]
+        city_id = self._names.get(normalize_name(name)) if name else None
+        if city_id is None:
+            return None
+        city = self.cities[city_id]
+        chord_squared = sum((p - q) ** 2 for p, q in zip(
+            spatial.to_unit_vector(lat, lng), spatial.to_unit_vector(city['lat'], city['lng'])))
+        return city_id if spatial.chord_to_km(chord_squared) <= NAME_MATCH_KM else None
+
+    def distance(self, a, b):
+        """Great-circle km between city ids a and b"""
+        return self._values[a * self._row + b * self._stride]
+
+    def emissions(self, a, b, mode):
+        """kg CO2 for one traveller from city a to city b by mode, or None for an unknown mode"""
+        slot = self._mode_slots.get(mode)
+        if slot is None:
+            return None
+        return self._values[a * self._row + b * self._stride + slot]
+
+
+_table = None
+_table_loaded = False
+_table_lock = threading.Lock()
+
+
+def get_table():
+    """The memory-mapped table, or None if it has not been built"""
+    global _table, _table_loaded
+    if not _table_loaded:
+        with _table_lock:
+            if not _table_loaded:
+                try:
+                    _table = PairTable(PAIR_TABLE_FILE)
+                    print(f"📐 Memory-mapped pair table with {len(_table)} cities from {PAIR_TABLE_FILE}")
+                except FileNotFoundError:
+                    print(f"📐 No pair table at {PAIR_TABLE_FILE} (run: python pair_table.py); computing live")
+                except ValueError as e:
+                    print(f"Error loading pair table {PAIR_TABLE_FILE}: {e}")
+                _table_loaded = True
+    return _table
+
+
+def lookup_ids(cities):
+    """Table ids for a list of {lat, lng} cities (None for cities not in the table)"""
+    table = get_table()
+    if table is None:
+        return [None] * len(cities)
+    ids = [table.city_id(city['lat'], city['lng'], city.get('name')) for city in cities]
+    for city_id in ids:
+        metrics.record_cache_lookup('pair_table', city_id is not None)
+    return ids
+
+
+def build_table(cities, modes, distance, mode_distance, emission_factors, path):
+    """
+    Write a table for `cities` ({name, lat, lng} dicts).
+
+    distance(lat1, lng1, lat2, lng2) and mode_distance(km, mode) come from
+    app.py; emission_factors maps mode to kg CO2 per routed km.
+    """
+    header = json.dumps({
+        'modes': modes,
+        'cities': [[c['name'], c['lat'], c['lng']] for c in cities]
+    }, separators=(',', ':')).encode('utf-8')
+
+    values = array('f')
+    for a in cities:
+        for b in cities:
+            km = distance(a['lat'], a['lng'], b['lat'], b['lng']) if a is not b else 0.0
+            values.append(km)
+            for mode in modes:
+                values.append(emission_factors[mode] * mode_distance(km, mode))
+    if sys.byteorder != 'little':
+        values.byteswap()
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(HEADER_LENGTH.pack(len(header)))
+        f.write(header)
+        values.tofile(f)
+    # Replace atomically so running workers keep their mapping of the old file
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the city-pair distance and emissions table')
+    parser.add_argument('--cities', default=os.path.join(DATA_DIR, 'cities.json'),
+                        help='JSON file with a "cities" list of {name, lat, lng}')
+    parser.add_argument('--output', default=PAIR_TABLE_FILE)
+    parser.add_argument('--emissions', choices=['static', 'climatiq'], default='static',
+                        help='Emission factors: the static CARBON_FACTORS or per-km factors from Climatiq')
+    args = parser.parse_args()
+
+    import app as backend
+    from structured_output import TRANSPORT_MODES
+
+    with open(args.cities, encoding='utf-8') as f:
+        cities = json.load(f)['cities']
+
+    if args.emissions == 'climatiq':
+        # Climatiq estimates scale linearly with distance, so one call per mode gives the factor
+        factors = {mode: backend.calculate_carbon_with_climatiq(mode, 1000) / 1000 for mode in TRANSPORT_MODES}
+    else:
+        factors = {mode: backend.CARBON_FACTORS[mode] for mode in TRANSPORT_MODES}
+
+    size = build_table(cities, TRANSPORT_MODES, backend.calculate_distance,
+                       backend.calculate_transport_distance, factors, args.output)
+    print(f"📐 Wrote {len(cities)} x {len(cities)} x {1 + len(TRANSPORT_MODES)} table "
+          f"({size / 1024:.0f} KB) to {args.output}")
+    print(f"   kg CO2 per km: {', '.join(f'{mode} {factor:.3f}' for mode, factor in factors.items())}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+Profiling Module
+Opt-in sampling profiler for slow requests with flamegraph-compatible output
+
+Configure with environment variables:
+    PROFILING            = off | header | always  (default: off)
+                           'header' profiles only requests sending X-EcoTrip-Profile: 1
+    PROFILING_INTERVAL_MS = sampling interval in milliseconds (default: 5)
+    PROFILING_SLOW_MS     = latency threshold for keeping a profile (default: 1000)
+    PROFILING_DIR         = directory for .folded dumps (default: profiles)
+    PROFILING_KEEP        = number of slowest recent requests kept in memory (default: 20)
+
+Dumps use the collapsed-stack format ("frame;frame;frame count") read by
+flamegraph.pl, speedscope and inferno.
+"""
+
+import os
+import sys
+import threading
+import uuid
+from collections import Counter, deque
+from datetime import datetime
+
+PROFILING_MODE = os.getenv('PROFILING', 'off').lower()
+PROFILING_INTERVAL_MS = float(os.getenv('PROFILING_INTERVAL_MS', '5'))
+PROFILING_SLOW_MS = float(os.getenv('PROFILING_SLOW_MS', '1000'))
+PROFILING_DIR = os.getenv('PROFILING_DIR', 'profiles')
+PROFILING_KEEP = int(os.getenv('PROFILING_KEEP', '20'))
+
+PROFILE_HEADER = 'X-EcoTrip-Profile'
+
+
+class StackSampler:
+    """Periodically samples the call stack of one thread from a background thread"""
+
+    def __init__(self, thread_id, interval_ms=PROFILING_INTERVAL_MS):
+        self.thread_id = thread_id
+        self.interval = interval_ms / 1000.0
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            # Root first, matching the collapsed-stack convention
+            self.samples[';'.join(reversed(stack))] += 1
+
+    def folded(self):
+        """Render samples in collapsed-stack format"""
+        return '\n'.join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+
+class SlowRequestLog:
+    """Ring buffer of recent slow requests, retrievable slowest first"""
+
+    def __init__(self, size=PROFILING_KEEP):
+        self._entries = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, entry):
+        with self._lock:
+            self._entries.append(entry)
+
+    def slowest(self, limit=None):
+        with self._lock:
+            entries = sorted(self._entries, key=lambda e: e['duration_ms'], reverse=True)
+        return entries[:limit] if limit else entries
+
+    def get(self, profile_id):
+        with self._lock:
+            for entry in self._entries:
+                if entry['id'] == profile_id:
+                    return entry
+        return None
+
+
+SLOW_REQUESTS = SlowRequestLog()
+
+
+def should_profile(headers):
+    """Decide whether the current request should be sampled"""
+    if PROFILING_MODE == 'always':
+        return True
+    if PROFILING_MODE == 'header':
+        return headers.get(PROFILE_HEADER) == '1'
+    return False
+
+
+def start_sampler():
+    """Begin sampling the calling thread"""
+    return StackSampler(threading.get_ident()).start()
+
+
+def finish_sampler(sampler, endpoint, duration_ms, status):
+    """Stop sampling and keep the profile if the request was slow"""
+    sampler.stop()
+    if duration_ms < PROFILING_SLOW_MS:
+        return None
+
+    profile_id = uuid.uuid4().hex[:12]
+    folded = sampler.folded()
+    entry = {
+        'id': profile_id,
+        'endpoint': endpoint,
+        'status': status,
+        'duration_ms': round(duration_ms, 1),
+        'sample_count': sum(sampler.samples.values()),
+        'timestamp': datetime.now().isoformat(),
+        'folded': folded,
+        'file': None
+    }
+
+    try:
+        os.makedirs(PROFILING_DIR, exist_ok=True)
+        slug = endpoint.strip('/').replace('/', '-') or 'root'
+        path = os.path.join(PROFILING_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{slug}-{int(duration_ms)}ms-{profile_id}.folded")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(folded + '\n')
+        entry['file'] = path
+    except OSError as e:
+        print(f"Error writing profile for {endpoint}: {e}")
+
+    SLOW_REQUESTS.add(entry)
+    print(f"🐢 Slow request {endpoint} took {duration_ms:.0f} ms (profile {profile_id})")
+    return entry
@@ -0,0 +1,315 @@
+"""
+Prompt Assembly Module
+Precompiled, prefix-cache-friendly prompts for the Llama chat API
+
+Static prompt text is compiled once at import. Messages are ordered so the
+static system prompt is always the first message and byte-identical across
+requests, followed by conversation history; everything that varies per
+request (itinerary status, trip context) is placed just before the user
+message. Providers that cache prompt prefixes can then reuse the system
+prompt on every request and the history on every turn of a conversation.
+
+Prompt variants can be A/B tested with PROMPT_VARIANTS, a comma-separated
+list of name:weight pairs (e.g. "full:50,compact:50"). Requests are
+assigned to a variant by hashing the conversation_id the client keeps for
+the whole conversation, so one conversation always sees the same variant
+(and the same static prefix). Clients that send no id fall back to the
+first message in the history window.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import metrics
+import structured_output
+
+# Rough characters-per-token ratio for English prompts with Llama tokenizers
+CHARS_PER_TOKEN = 4
+
+FULL_MARKERS_PROMPT = """You are an eco-friendly travel assistant that helps users plan sustainable itineraries.
+
+YOUR PROCESS:
+1. When users mention 2 or more cities, immediately create an itinerary - don't ask for more details
+2. If they mention cities without specifying order, tell them you'll optimize the route for minimal emissions
+3. Provide the complete itinerary right away - no need to ask for travel dates, preferences, or additional cities
+4. Focus on the cities mentioned and create the best eco-friendly route between them
+
+WHEN YOU HAVE ENOUGH CITIES TO CREATE AN ITINERARY, use this EXACT format:
+
+"Great! I've created an eco-friendly itinerary for your trip. Here's what I've planned:
+
+[Write a friendly, conversational message about the itinerary. Include:
+- Mention the cities in order
+- Highlight any eco-friendly aspects (like train options, scenic routes)
+- Keep it warm and encouraging
+- Don't mention technical details like coordinates or transport modes - those are handled automatically]
+
+💡 **Eco Tip**: [Brief advice about sustainable travel for this route]
+
+**ITINERARY_DATA**
+{
+    "cities": [
+        {"name": "New York City, NY", "lat": 40.7128, "lng": -74.0060},
+        {"name": "Chicago, IL", "lat": 41.8781, "lng": -87.6298},
+        {"name": "Denver, CO", "lat": 39.7392, "lng": -104.9903}
+    ],
+    "segments": [
+        {
+            "from": "New York City, NY",
+            "to": "Chicago, IL",
+            "transport_modes": ["car", "train", "flight", "bus"]
+        },
+        {
+            "from": "Chicago, IL", 
+            "to": "Denver, CO",
+            "transport_modes": ["car", "flight", "bus"]
+        }
+    ]
+}
+**END_ITINERARY_DATA**"
+
+CRITICAL REQUIREMENTS:
+- ALWAYS include the **ITINERARY_DATA** section with accurate coordinates and realistic transport options
+- Optimize city order for minimal total travel distance
+- Use accurate latitude and longitude coordinates for each city
+- For transport_modes, ALWAYS include ALL feasible options between cities:
+  * "car" - ALWAYS include for road connections (highways, major roads)
+  * "train" - include if passenger rail service exists (Amtrak, regional rail, high-speed rail)
+  * "flight" - include for commercial air routes (major airports)
+  * "bus" - include for intercity bus services (Greyhound, Megabus, regional carriers)
+- Be INCLUSIVE rather than restrictive - if there's any reasonable way to travel between cities, include it
+- Consider actual transportation infrastructure but don't be overly restrictive
+- For US routes: Amtrak, major highways, commercial flights, and intercity buses are usually available
+- For international routes: include all major transport options
+- Be conversational and encouraging about sustainable travel
+- If user mentions 2+ cities, create itinerary immediately - don't ask for more details
+- Never ask for travel dates, mode preferences, or additional cities
+- For non-itinerary responses, be helpful and conversational without the ITINERARY_DATA section"""
+
+COMPACT_MARKERS_PROMPT = """You are an eco-friendly travel assistant that helps users plan sustainable itineraries.
+When the user mentions 2 or more cities, create the itinerary right away; never ask for dates, preferences or more cities.
+Order the cities to minimize total travel distance and say you optimized the route for low emissions.
+
+For an itinerary, reply with a short, warm message naming the cities in order and highlighting eco-friendly options,
+then "💡 **Eco Tip**: ..." and finally the data block (no coordinates or modes in the message):
+
+**ITINERARY_DATA**
+{"cities": [{"name": "Paris, France", "lat": 48.8566, "lng": 2.3522}, {"name": "Lyon, France", "lat": 45.764, "lng": 4.8357}],
+ "segments": [{"from": "Paris, France", "to": "Lyon, France", "transport_modes": ["car", "train", "flight", "bus"]}]}
+**END_ITINERARY_DATA**
+
+Use accurate coordinates. For transport_modes include every feasible option among car (any road link), train
+(passenger rail), flight (commercial air) and bus (intercity coaches); be inclusive.
+For non-itinerary replies, be helpful and conversational without the data block."""
+
+# Static system prompts per LLM_MODE and variant
+VARIANTS = {
+    'markers': {
+        'full': FULL_MARKERS_PROMPT,
+        'compact': COMPACT_MARKERS_PROMPT,
+    },
+    'json_schema': {
+        'full': structured_output.SYSTEM_PROMPT + "\n" + structured_output.JSON_SCHEMA_INSTRUCTIONS,
+    },
+    'tool': {
+        'full': structured_output.SYSTEM_PROMPT + "\n" + structured_output.TOOL_INSTRUCTIONS,
+    },
+}
+
+DEFAULT_VARIANT = 'full'
+
+EXISTING_ITINERARY_NOTE = """IMPORTANT: There is already an existing trip itinerary.
+- If the user wants to modify the current itinerary, help them refine it
+- If they mention new cities, integrate them into the existing plan
+- If they want to start over, create a new itinerary
+- Always maintain context of the current trip when responding"""
+
+TRIP_CONTEXT_TEMPLATE = """Current trip planning status:
+- {count} destinations already identified: {names}
+- Transportation preference: {transportation}
+- Any specific requirements: {requirements}
+
+Use this information to build upon the existing plan or help refine it."""
+
+HISTORY_LIMIT = 20  # Last 20 messages (10 exchanges)
+
+# Conversations whose previous prompt is remembered for cacheable-prefix accounting
+PREVIOUS_PROMPTS_SIZE = 1024
+
+PROMPT_TOKENS = metrics.REGISTRY.histogram(
+    'ecotrip_prompt_tokens', 'Estimated prompt tokens per LLM request', ('variant', 'part'),
+    buckets=(100, 250, 500, 750, 1000, 1500, 2000, 3000, 4000, 6000, 8000))
+COMPLETION_TOKENS = metrics.REGISTRY.histogram(
+    'ecotrip_completion_tokens', 'Completion tokens per LLM request, when reported', ('variant',),
+    buckets=(25, 50, 100, 200, 300, 400, 500, 750, 1000))
+
+
+def chars_to_tokens(chars):
+    """Cheap token estimate used for prefix and variant reporting"""
+    return (chars + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def estimate_tokens(text):
+    return chars_to_tokens(len(text))
+
+
+def _parse_weights(spec):
+    weights = []
+    for part in (spec or '').split(','):
+        name, _, weight = part.strip().partition(':')
+        if name:
+            weights.append((name, int(weight) if weight.strip().isdigit() else 1))
+    return [(name, weight) for name, weight in weights if weight > 0]
+
+
+VARIANT_WEIGHTS = _parse_weights(os.getenv('PROMPT_VARIANTS', DEFAULT_VARIANT))
+
+
+def choose_variant(mode, conversation_key):
+    """Deterministically assign a conversation to one of the configured variants"""
+    available = VARIANTS.get(mode, VARIANTS['markers'])
+    weights = [(name, weight) for name, weight in VARIANT_WEIGHTS if name in available]
+    if not weights:
+        return DEFAULT_VARIANT
+    total = sum(weight for _, weight in weights)
+    bucket = int(hashlib.sha1(conversation_key.encode('utf-8')).hexdigest()[:8], 16) % total
+    for name, weight in weights:
+        if bucket < weight:
+            return name
+        bucket -= weight
+    return weights[-1][0]
+
+
+def build_dynamic_context(trip_context=None, has_itinerary=False):
+    """Per-request system text (itinerary status and trip context), or None"""
+    parts = []
+    if has_itinerary:
+        parts.append(EXISTING_ITINERARY_NOTE)
+    if trip_context and trip_context.get('destinations'):
+        destinations = trip_context.get('destinations', [])
+        parts.append(TRIP_CONTEXT_TEMPLATE.format(
+            count=len(destinations),
+            names=', '.join([d.get('name', 'Unknown') for d in destinations]),
+            transportation=trip_context.get('transportation', 'Not specified'),
+            requirements=trip_context.get('requirements', 'None specified')
+        ))
+    return '\n\n'.join(parts) or None
+
+
+class _PreviousPrompts:
+    """Message fingerprints of each conversation's last prompt, to measure the prefix shared with it"""
+
+    def __init__(self, size):
+        self.size = size
+        self._prompts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def shared_prefix_chars(self, conversation_key, messages):
+        """Characters of the leading messages identical to this conversation's previous prompt"""
+        fingerprints = [(hash((m['role'], m['content'])), len(m['content'])) for m in messages]
+        with self._lock:
+            previous = self._prompts.get(conversation_key, [])
+            self._prompts[conversation_key] = fingerprints
+            self._prompts.move_to_end(conversation_key)
+            while len(self._prompts) > self.size:
+                self._prompts.popitem(last=False)
+        shared = 0
+        for current, before in zip(fingerprints, previous):
+            if current != before:
+                break
+            shared += current[1]
+        return shared
+
+
+_previous_prompts = _PreviousPrompts(PREVIOUS_PROMPTS_SIZE)
+
+
+class PromptBuild:
+    """Assembled messages plus the prefix/token accounting for one request"""
+
+    def __init__(self, mode, variant, messages, static_prefix_chars, shared_prefix_chars):
+        self.mode = mode
+        self.variant = variant
+        self.messages = messages
+        self.static_prefix_chars = static_prefix_chars
+        self.shared_prefix_chars = shared_prefix_chars
+        self.total_chars = sum(len(m['content']) for m in messages)
+
+    @property
+    def static_prefix_tokens(self):
+        return chars_to_tokens(self.static_prefix_chars)
+
+    @property
+    def cacheable_prefix_tokens(self):
+        """Leading messages shared with the previous turn's prompt, and at least the system prompt"""
+        return chars_to_tokens(max(self.static_prefix_chars, self.shared_prefix_chars))
+
+    @property
+    def total_tokens(self):
+        return chars_to_tokens(self.total_chars)
+
+    def stats(self):
+        return {
+            'mode': self.mode,
+            'variant': self.variant,
+            'static_prefix_tokens': self.static_prefix_tokens,
+            'cacheable_prefix_tokens': self.cacheable_prefix_tokens,
+            'prompt_tokens': self.total_tokens
+        }
+
+
+def build_messages(mode, user_message, trip_context=None, conversation_history=None, has_itinerary=False,
+                   conversation_id=None):
+    """
+    Assemble chat messages in cache-friendly order:
+
+        [static system prompt] [history ...] [dynamic system context] [user message]
+
+    conversation_id is the client's stable id for the conversation; it picks
+    the prompt variant and matches this prompt against the previous turn's.
+    """
+    history = [
+        {"role": msg.get('role', 'user'), "content": msg.get('content', '')}
+        for msg in (conversation_history or [])[-HISTORY_LIMIT:]
+    ]
+    if isinstance(conversation_id, str) and conversation_id:
+        conversation_key = conversation_id[:128]
+    else:
+        # Only stable until the client's history window starts sliding
+        conversation_key = history[0]['content'] if history else user_message
+    variant = choose_variant(mode, conversation_key)
+    system_prompt = VARIANTS.get(mode, VARIANTS['markers']).get(variant, VARIANTS['markers'][DEFAULT_VARIANT])
+
+    messages = [{"role": "system", "content": system_prompt}]
+    messages.extend(history)
+    dynamic = build_dynamic_context(trip_context, has_itinerary)
+    if dynamic:
+        messages.append({"role": "system", "content": dynamic})
+    messages.append({"role": "user", "content": user_message})
+
+    build = PromptBuild(mode, variant, messages, len(system_prompt),
+                        _previous_prompts.shared_prefix_chars(conversation_key, messages))
+    PROMPT_TOKENS.observe(build.static_prefix_tokens, variant=variant, part='static_prefix')
+    PROMPT_TOKENS.observe(build.cacheable_prefix_tokens, variant=variant, part='cacheable_prefix')
+    PROMPT_TOKENS.observe(build.total_tokens, variant=variant, part='total')
+    return build
+
+
+def record_usage(build, result):
+    """Record completion tokens from a Llama API response's metrics, if present"""
+    for metric in result.get('metrics') or []:
+        if metric.get('metric') == 'num_completion_tokens':
+            COMPLETION_TOKENS.observe(metric.get('value', 0), variant=build.variant)
+
+
+def variant_summary():
+    """Static prompt sizes for every mode and variant"""
+    return {
+        mode: {
+            name: {'chars': len(text), 'estimated_tokens': estimate_tokens(text)}
+            for name, text in variants.items()
+        }
+        for mode, variants in VARIANTS.items()
+    }
@@ -0,0 +1,172 @@
+"""
+Responses Module
+Fast JSON encoding, response compression and the compact itinerary format
+
+FastJSONProvider replaces Flask's stdlib encoder with orjson when it is
+installed (pip install orjson), so every jsonify() call gets the faster
+encoder. compress_response() gzips (or brotli-compresses, when the brotli
+package is installed) JSON and text responses above a size threshold for
+clients that accept it. compact_itinerary() rewrites the /api/chat itinerary
+into columnar arrays for clients that ask for ?format=compact.
+
+Configure with environment variables:
+    RESPONSE_COMPRESSION            = 'on' (default) or 'off'
+    RESPONSE_COMPRESSION_MIN_BYTES  = smallest body worth compressing (default: 1024)
+    RESPONSE_COMPRESSION_LEVEL      = gzip level 1-9 (default: 6)
+"""
+
+import gzip
+import os
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+import metrics
+from static_assets import accepted_encodings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+RESPONSE_COMPRESSION = os.getenv('RESPONSE_COMPRESSION', 'on').lower() != 'off'
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv('RESPONSE_COMPRESSION_MIN_BYTES', '1024'))
+RESPONSE_COMPRESSION_LEVEL = int(os.getenv('RESPONSE_COMPRESSION_LEVEL', '6'))
+
+# Dynamic responses favour speed over ratio; static assets are precompressed at quality 11
+BROTLI_QUALITY = 5
+
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/plain'}
+
+# Columns of the compact transport options table, in order
+OPTION_COLUMNS = ['mode', 'distance_km', 'duration_hours', 'carbon_kg', 'occupancy', 'recommended']
+
+COMPRESSED_RESPONSES = metrics.REGISTRY.counter(
+    'ecotrip_response_compression_total', 'Responses compressed on the fly', ('encoding',))
+RESPONSE_BYTES = metrics.REGISTRY.counter(
+    'ecotrip_response_compression_bytes_total', 'Body bytes before and after on-the-fly compression', ('stage',))
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson, falling back to the stdlib encoder"""
+
+    def _options(self):
+        return orjson.OPT_SORT_KEYS if self.sort_keys else 0
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or set(kwargs) - {'sort_keys'}:
+            return super().dumps(obj, **kwargs)
+        try:
+            return orjson.dumps(obj, default=self.default, option=self._options()).decode('utf-8')
+        except TypeError:
+            # Integers beyond 64 bits and other values orjson refuses
+            return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        try:
+            return orjson.loads(s)
+        except orjson.JSONDecodeError:
+            # NaN/Infinity literals are accepted by the stdlib parser
+            return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        pretty = (self.compact is None and self._app.debug) or self.compact is False
+        if orjson is None or pretty:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        try:
+            body = orjson.dumps(obj, default=self.default,
+                                option=self._options() | orjson.OPT_APPEND_NEWLINE)
+        except TypeError:
+            return super().response(*args, **kwargs)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def _negotiate_encoding():
+    accepted = accepted_encodings()
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def compress_response(response):
+    """Compress a JSON or text response in place when it is large enough and the client accepts it"""
+    if (not RESPONSE_COMPRESSION or response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if len(body) < RESPONSE_COMPRESSION_MIN_BYTES:
+        return response
+    encoding = _negotiate_encoding()
+    if encoding is None:
+        return response
+
+    if encoding == 'br':
+        compressed = brotli.compress(body, quality=BROTLI_QUALITY)
+    else:
+        compressed = gzip.compress(body, compresslevel=RESPONSE_COMPRESSION_LEVEL, mtime=0)
+    if len(compressed) >= len(body):
+        return response
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    # The compressed body is a different byte sequence, so a strong validator becomes weak
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    COMPRESSED_RESPONSES.inc(encoding=encoding)
+    RESPONSE_BYTES.inc(len(body), stage='uncompressed')
+    RESPONSE_BYTES.inc(len(compressed), stage='sent')
+    return response
+
+
+def wants_compact():
+    """True when the client opted into the compact response format"""
+    return request.args.get('format', '').lower() == 'compact'
+
+
+def compact_itinerary(itinerary):
+    """
+    Columnar form of a processed itinerary.
+
+    Cities become [name, lat, lng] rows. Segment i always joins cities[i] and
+    cities[i + 1], so from/to names and coordinates are dropped, and all
+    transport options are flattened into one table of parallel arrays where
+    options['segment'][k] is the segment index of row k. Each distinct map
+    line is sent once in lines, and options['line'][k] is its index there.
+    """
+    options = {'segment': [], 'line': []}
+    options.update({column: [] for column in OPTION_COLUMNS})
+    lines, line_index = [], {}
+    for i, segment in enumerate(itinerary['segments']):
+        segment_geometry = segment.get('geometry') or {'lines': {}, 'modes': {}}
+        for option in segment['transport_options']:
+            options['segment'].append(i)
+            for column in OPTION_COLUMNS:
+                options[column].append(option.get(column))
+            line = segment_geometry['lines'].get(segment_geometry['modes'].get(option.get('mode')))
+            if line is not None and line not in line_index:
+                line_index[line] = len(lines)
+                lines.append(line)
+            options['line'].append(line_index.get(line))
+    return {
+        'format': 'compact',
+        'cities': [[city['name'], city['lat'], city['lng']] for city in itinerary['cities']],
+        'direct_distance_km': [segment['direct_distance_km'] for segment in itinerary['segments']],
+        'lines': lines,
+        'options': options,
+        'total_segments': itinerary['total_segments']
+    }
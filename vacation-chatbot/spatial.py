@@ -0,0 +1,168 @@
+"""
+Spatial Index Module
+k-d tree over unit-sphere coordinates for nearest-city and radius queries
+
+Points are stored as 3D unit vectors, so straight-line (chord) distance
+orders them exactly like great-circle distance, with no trouble at the poles
+or the antimeridian. The tree is implicit: a node is a slice of one sorted
+index array whose middle element is the split point. That keeps 100k points
+in a few flat lists, and a k-nearest or radius query visits only a few dozen
+nodes. Points can be removed, which is what the nearest-neighbour route
+builder needs.
+"""
+
+import heapq
+import math
+
+import fast_path
+
+EARTH_RADIUS_KM = 6371
+
+
+def to_unit_vector(lat, lng):
+    """Latitude/longitude in degrees to a point on the unit sphere"""
+    phi, lam = math.radians(lat), math.radians(lng)
+    cos_phi = math.cos(phi)
+    return cos_phi * math.cos(lam), cos_phi * math.sin(lam), math.sin(phi)
+
+
+def chord_to_km(chord_squared):
+    """Great-circle distance in km for a squared chord length on the unit sphere"""
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(chord_squared) / 2))
+
+
+def km_to_chord_squared(km):
+    """Squared chord length on the unit sphere for a great-circle distance in km"""
+    if km >= math.pi * EARTH_RADIUS_KM:
+        return 4.0
+    return (2 * math.sin(km / (2 * EARTH_RADIUS_KM))) ** 2
+
+
+class SpatialIndex:
+    """
+    Static k-d tree with removal.
+
+    Query results are (distance_km, i) pairs, where i indexes the `points`
+    (and `items`) the index was built from, nearest first.
+    """
+
+    def __init__(self, points, items=None):
+        self.items = items if items is not None else list(points)
+        self._coords = [to_unit_vector(lat, lng) for lat, lng in points]
+        n = len(self._coords)
+        self._order = list(range(n))
+        self._axis = [0] * n
+        self._alive = [0] * n  # live points in the subtree whose split is at this slot
+        self._present = [True] * n
+        self._slot = [0] * n  # slot of each point in _order
+        self._build(0, n)
+        for slot, i in enumerate(self._order):
+            self._slot[i] = slot
+
+    @classmethod
+    def from_items(cls, items, key=None):
+        """Index dicts with 'lat' and 'lng' (or whatever key(item) returns as (lat, lng))"""
+        key = key or (lambda item: (item['lat'], item['lng']))
+        return cls([key(item) for item in items], items)
+
+    def __len__(self):
+        return self._alive[len(self._order) // 2] if self._order else 0
+
+    def _build(self, lo, hi):
+        # Iterative to avoid recursion limits on large inputs
+        stack = [(lo, hi)]
+        coords = self._coords
+        while stack:
+            lo, hi = stack.pop()
+            if lo >= hi:
+                continue
+            mid = (lo + hi) // 2
+            self._alive[mid] = hi - lo
+            if hi - lo == 1:
+                continue
+            # Split on the axis with the widest spread
+            spans = []
+            for axis in range(3):
+                values = [coords[i][axis] for i in self._order[lo:hi]]
+                spans.append(max(values) - min(values))
+            axis = spans.index(max(spans))
+            self._axis[mid] = axis
+            self._order[lo:hi] = sorted(self._order[lo:hi], key=lambda i: coords[i][axis])
+            stack.append((lo, mid))
+            stack.append((mid + 1, hi))
+
+    def remove(self, i):
+        """Remove point i from future query results"""
+        if not self._present[i]:
+            return
+        self._present[i] = False
+        target = self._slot[i]
+        lo, hi = 0, len(self._order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            self._alive[mid] -= 1
+            if target == mid:
+                break
+            if target < mid:
+                hi = mid
+            else:
+                lo = mid + 1
+
+    def nearest(self, lat, lng, k=1, max_km=None):
+        """The k nearest live points, optionally no farther than max_km"""
+        limit = km_to_chord_squared(max_km) if max_km is not None else float('inf')
+        found = self._search(to_unit_vector(lat, lng), k, limit)
+        return [(chord_to_km(d2), i) for d2, i in found]
+
+    def within(self, lat, lng, radius_km):
+        """All live points within radius_km"""
+        found = self._search(to_unit_vector(lat, lng), None, km_to_chord_squared(radius_km))
+        return [(chord_to_km(d2), i) for d2, i in found]
+
+    def _search(self, query, k, limit):
+        qx, qy, qz = query
+        coords, order, axes, alive, present = self._coords, self._order, self._axis, self._alive, self._present
+        # Max-heap of the best k as (-d2, -i); ties go to the lower index
+        best = []
+        stack = [(0, len(order), 0.0)]
+        while stack:
+            lo, hi, bound = stack.pop()
+            worst = -best[0][0] if k is not None and len(best) == k else limit
+            if lo >= hi or bound > worst:
+                continue
+            mid = (lo + hi) // 2
+            if not alive[mid]:
+                continue
+            i = order[mid]
+            x, y, z = coords[i]
+            if present[i]:
+                d2 = (qx - x) ** 2 + (qy - y) ** 2 + (qz - z) ** 2
+                if d2 <= limit:
+                    if k is None:
+                        best.append((d2, i))
+                    elif len(best) < k:
+                        heapq.heappush(best, (-d2, -i))
+                    elif (-d2, -i) > best[0]:
+                        heapq.heapreplace(best, (-d2, -i))
+            diff = query[axes[mid]] - coords[i][axes[mid]]
+            if diff < 0:
+                near, far = (lo, mid), (mid + 1, hi)
+            else:
+                near, far = (mid + 1, hi), (lo, mid)
+            # Far side first so the near side is explored (and tightens the bound) first
+            stack.append((far[0], far[1], max(bound, diff * diff)))
+            stack.append((near[0], near[1], bound))
+        if k is None:
+            return sorted(best)
+        return sorted((-neg_d2, -neg_i) for neg_d2, neg_i in best)
+
+
+_city_index = None
+
+
+def get_city_index():
+    """Spatial index over the bundled city list, built on first use"""
+    global _city_index
+    if _city_index is None:
+        _city_index = SpatialIndex.from_items(fast_path.get_index().cities)
+    return _city_index
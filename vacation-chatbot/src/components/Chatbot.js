@@ -1,5 +1,62 @@
 import React, { useState, useRef, useEffect } from 'react';
 
+// Rebuild the regular itinerary shape from the columnar ?format=compact response
+const OPTION_COLUMNS = ['mode', 'distance_km', 'duration_hours', 'carbon_kg', 'occupancy', 'recommended'];
+
+const expandCompactItinerary = (itinerary) => {
+  if (!itinerary || itinerary.format !== 'compact') return itinerary;
+
+  const cities = itinerary.cities.map(([name, lat, lng]) => ({ name, lat, lng }));
+  const segments = itinerary.direct_distance_km.map((distance, i) => ({
+    from: cities[i].name,
+    to: cities[i + 1].name,
+    from_coords: { lat: cities[i].lat, lng: cities[i].lng },
+    to_coords: { lat: cities[i + 1].lat, lng: cities[i + 1].lng },
+    direct_distance_km: distance,
+    transport_options: [],
+    // Line indexes into the shared itinerary.lines stand in for geometry keys
+    geometry: { lines: {}, modes: {} }
+  }));
+  itinerary.options.segment.forEach((segmentIndex, row) => {
+    const option = {};
+    OPTION_COLUMNS.forEach(column => {
+      option[column] = itinerary.options[column][row];
+    });
+    segments[segmentIndex].transport_options.push(option);
+    const line = itinerary.options.line[row];
+    if (line !== null && line !== undefined) {
+      segments[segmentIndex].geometry.lines[line] = itinerary.lines[line];
+      segments[segmentIndex].geometry.modes[option.mode] = String(line);
+    }
+  });
+
+  return { cities, segments, total_segments: itinerary.total_segments };
+};
+
+// Fill in the legs the server reused (sent as null) from the previous trip's segments
+const applySegmentDelta = (itinerary, delta, previousSegments) => {
+  if (!itinerary || !delta || !previousSegments) return itinerary;
+
+  const reusedFrom = {};
+  delta.reused.forEach(([newIndex, oldIndex]) => {
+    reusedFrom[newIndex] = oldIndex;
+  });
+  const segments = itinerary.segments.map((segment, i) => {
+    if (segment) return segment;
+    const from = itinerary.cities[i];
+    const to = itinerary.cities[i + 1];
+    return {
+      ...previousSegments[reusedFrom[i]],
+      from: from.name,
+      to: to.name,
+      from_coords: { lat: from.lat, lng: from.lng },
+      to_coords: { lat: to.lat, lng: to.lng }
+    };
+  });
+
+  return { ...itinerary, segments };
+};
+
 function Chatbot({ onTripUpdate, tripData, onLocationSelect }) {
   const [messages, setMessages] = useState([
     {
@@ -15,6 +72,13 @@ function Chatbot({ onTripUpdate, tripData, onLocationSelect }) {
   // Store conversation history for API context
   const [conversationHistory, setConversationHistory] = useState([]);
 
+  // Stable for the whole conversation, so the server keeps one prompt variant and prefix
+  const [conversationId] = useState(() =>
+    (window.crypto && window.crypto.randomUUID)
+      ? window.crypto.randomUUID()
+      : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`
+  );
+
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
   };
@@ -25,15 +89,18 @@ function Chatbot({ onTripUpdate, tripData, onLocationSelect }) {
 
   const sendMessageToAPI = async (userMessage) => {
     try {
-      const response = await fetch('/api/chat', {
+      const response = await fetch('/api/chat?format=compact', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
         },
         body: JSON.stringify({
           message: userMessage,
+          conversation_id: conversationId,
           trip_context: tripData,
-          conversation_history: conversationHistory.slice(-10) // Send last 10 messages for context
+          conversation_history: conversationHistory.slice(-10), // Send last 10 messages for context
+          // Unchanged legs come back as null and are reused from tripData.segments
+          segment_delta_only: Boolean(tripData.segments && tripData.segments.length > 0)
         })
       });
 
@@ -42,6 +109,8 @@ function Chatbot({ onTripUpdate, tripData, onLocationSelect }) {
       }
 
       const data = await response.json();
+      data.itinerary = expandCompactItinerary(data.itinerary);
+      data.itinerary = applySegmentDelta(data.itinerary, data.segment_delta, tripData.segments);
       return data;
     } catch (error) {
       console.error('Error calling chatbot API:', error);
@@ -57,8 +126,8 @@ function Chatbot({ onTripUpdate, tripData, onLocationSelect }) {
       const apiResponse = await sendMessageToAPI(userMessage);
       
       let botResponse;
-      if (apiResponse && apiResponse.response) {
-        botResponse = apiResponse.response;
+      if (apiResponse && (apiResponse.response || apiResponse.itinerary)) {
+        botResponse = apiResponse.response || "I've updated your itinerary - check the trip summary for the details.";
         
         // Check if API returned itinerary data
         if (apiResponse.itinerary) {
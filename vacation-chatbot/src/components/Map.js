@@ -9,10 +9,12 @@ function Map({ tripData, selectedLocation, onLocationSelect }) {
       console.log('🔄 Sending destinations to iframe map:', tripData.destinations);
       iframeRef.current.contentWindow.postMessage({
         type: 'update-markers',
-        destinations: tripData.destinations
+        destinations: tripData.destinations,
+        // Segments carry server-generated geometry for the route lines
+        segments: tripData.segments
       }, '*');
     }
-  }, [tripData?.destinations]);
+  }, [tripData?.destinations, tripData?.segments]);
 
   // Listen for messages from the iframe
   useEffect(() => {
@@ -0,0 +1,132 @@
+"""
+Static Assets Module
+Serves files from public/ with precompressed variants, ETags and cache headers
+
+generate_html.py writes content-hashed assets (e.g. static/map.3f2a9c1b.js)
+plus .gz and .br siblings next to every text asset. This module picks the
+best precompressed variant for the client's Accept-Encoding, answers
+conditional GETs with 304, and marks fingerprinted files as immutable while
+HTML entry points are always revalidated.
+"""
+
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+
+from flask import Response, abort, current_app, request
+from werkzeug.security import safe_join
+
+import metrics
+
+# Fingerprinted names look like name.<8+ hex chars>.ext
+HASHED_NAME_PATTERN = re.compile(r'\.[0-9a-f]{8,}\.[A-Za-z0-9]+$')
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+# Preferred order when the client accepts several encodings
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+COMPRESSIBLE_EXTENSIONS = {'.html', '.css', '.js', '.json', '.svg', '.txt', '.map', '.ico'}
+
+
+class _FileInfo:
+    def __init__(self, path, stat, etag):
+        self.path = path
+        self.mtime = stat.st_mtime
+        self.size = stat.st_size
+        self.etag = etag
+
+
+_etag_cache = {}
+_etag_lock = threading.Lock()
+
+
+def _file_info(path):
+    """Stat a file and return its strong ETag, hashing the content only when it changed"""
+    stat = os.stat(path)
+    with _etag_lock:
+        cached = _etag_cache.get(path)
+        if cached and cached.mtime == stat.st_mtime and cached.size == stat.st_size:
+            metrics.record_cache_lookup('static_etag', True)
+            return cached
+
+    metrics.record_cache_lookup('static_etag', False)
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    info = _FileInfo(path, stat, f'"{digest.hexdigest()[:20]}"')
+    with _etag_lock:
+        _etag_cache[path] = info
+    return info
+
+
+def accepted_encodings():
+    """Content codings the client accepts (ignoring those with q=0)"""
+    accepted = set()
+    for part in request.headers.get('Accept-Encoding', '').split(','):
+        coding, _, params = part.strip().partition(';')
+        if coding and params.replace(' ', '') not in ('q=0', 'q=0.0'):
+            accepted.add(coding.lower())
+    return accepted
+
+
+def etag_matches(etag):
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    candidates = [tag.strip() for tag in header.split(',')]
+    return etag in candidates or f'W/{etag}' in candidates
+
+
+def cache_control_for(filename):
+    if HASHED_NAME_PATTERN.search(filename):
+        return IMMUTABLE_CACHE_CONTROL
+    return REVALIDATE_CACHE_CONTROL
+
+
+def serve_static(directory, filename):
+    """Serve directory/filename with encoding negotiation, ETag and Cache-Control"""
+    # Relative directories resolve against the app, like send_from_directory, not the working directory
+    path = safe_join(os.path.join(current_app.root_path, directory), filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    if content_type.startswith('text/') or content_type in ('application/javascript', 'application/json'):
+        content_type += '; charset=utf-8'
+
+    info = _file_info(path)
+
+    # Pick the smallest precompressed variant the client accepts, ignoring stale ones
+    serve_path, encoding = path, None
+    if os.path.splitext(path)[1].lower() in COMPRESSIBLE_EXTENSIONS:
+        accepted = accepted_encodings()
+        for coding, suffix in ENCODINGS:
+            variant = path + suffix
+            if coding in accepted and os.path.isfile(variant) and os.path.getmtime(variant) >= info.mtime:
+                serve_path, encoding = variant, coding
+                break
+    # Each encoding is a different representation, so it needs its own validator
+    etag = info.etag if encoding is None else f'{info.etag[:-1]}-{encoding}"'
+
+    headers = {
+        'ETag': etag,
+        'Cache-Control': cache_control_for(filename),
+        'Vary': 'Accept-Encoding'
+    }
+
+    if etag_matches(etag):
+        return Response(status=304, headers=headers)
+
+    with open(serve_path, 'rb') as f:
+        body = f.read()
+    if encoding:
+        headers['Content-Encoding'] = encoding
+
+    return Response(body, content_type=content_type, headers=headers)
@@ -0,0 +1,256 @@
+"""
+Structured Output Module
+Compact JSON schema, validation and repair for LLM itinerary extraction
+
+Used when LLM_MODE is 'json_schema' (the whole reply is constrained JSON) or
+'tool' (the itinerary arrives as a set_itinerary function call). Both use the
+same compact itinerary shape:
+
+    {"cities": [["Paris, France", 48.86, 2.35], ["Lyon, France", 45.76, 4.84]],
+     "segments": [["train", "car", "bus"]]}
+
+where segments[i] lists the transport modes between cities[i] and cities[i + 1].
+"""
+
+import json
+import re
+
+import metrics
+
+TRANSPORT_MODES = ['car', 'train', 'flight', 'bus']
+
+ITINERARY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "cities": {
+            "type": "array",
+            "minItems": 2,
+            "items": {
+                "type": "array",
+                "prefixItems": [{"type": "string"}, {"type": "number"}, {"type": "number"}],
+                "minItems": 3,
+                "maxItems": 3
+            }
+        },
+        "segments": {
+            "type": "array",
+            "items": {
+                "type": "array",
+                "minItems": 1,
+                "items": {"type": "string", "enum": TRANSPORT_MODES}
+            }
+        }
+    },
+    "required": ["cities", "segments"],
+    "additionalProperties": False
+}
+
+REPLY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "message": {"type": "string"},
+        "itinerary": {"anyOf": [ITINERARY_SCHEMA, {"type": "null"}]}
+    },
+    "required": ["message", "itinerary"],
+    "additionalProperties": False
+}
+
+TOOL_NAME = 'set_itinerary'
+
+SYSTEM_PROMPT = """You are an eco-friendly travel assistant that helps users plan sustainable itineraries.
+When the user mentions 2 or more cities, plan the trip immediately without asking for dates or preferences.
+Order cities to minimize total travel distance. Give accurate coordinates as [name, lat, lng].
+For each leg list every feasible mode among car, train, flight, bus; be inclusive.
+Write a short, warm message naming the cities in order and ending with a one-line "💡 **Eco Tip**:".
+Never mention coordinates or transport mode lists in the message."""
+
+JSON_SCHEMA_INSTRUCTIONS = """Reply with JSON only: {"message": string, "itinerary": object or null}.
+Set itinerary to null when the user has not named at least 2 cities."""
+
+TOOL_INSTRUCTIONS = f"""Reply to the user in plain text. When you plan or change a route, also call {TOOL_NAME}."""
+
+REPAIR_PROMPT = """The JSON below does not match the required schema. Return only the corrected JSON, nothing else.
+Schema: {schema}
+Problems: {problems}"""
+
+# Shown when neither a message nor an itinerary survives parsing and repair
+FALLBACK_MESSAGE = ("I'm sorry, I couldn't put that trip together just now. "
+                    "Could you list the cities you'd like to visit again?")
+
+ITINERARY_REPAIRS = metrics.REGISTRY.counter(
+    'ecotrip_itinerary_repairs_total', 'Structured itinerary repair attempts by outcome', ('result',))
+
+CODE_FENCE_PATTERN = re.compile(r'^\s*```(?:json)?\s*|\s*```\s*$')
+TRAILING_COMMA_PATTERN = re.compile(r',\s*([\]}])')
+
+
+def response_format():
+    """Llama API response_format constraining the reply to REPLY_SCHEMA"""
+    return {"type": "json_schema", "json_schema": {"name": "itinerary_reply", "schema": REPLY_SCHEMA}}
+
+
+def itinerary_tool():
+    """Tool definition the model calls with the compact itinerary"""
+    return {
+        "type": "function",
+        "function": {
+            "name": TOOL_NAME,
+            "description": "Record the planned trip: ordered cities and transport modes per leg",
+            "parameters": ITINERARY_SCHEMA
+        }
+    }
+
+
+def loads_lenient(text):
+    """json.loads that tolerates code fences, surrounding prose and trailing commas"""
+    if isinstance(text, (dict, list)):
+        return text
+    text = CODE_FENCE_PATTERN.sub('', text or '').strip()
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    start, end = text.find('{'), text.rfind('}')
+    if start == -1 or end <= start:
+        raise ValueError('no JSON object found')
+    candidate = TRAILING_COMMA_PATTERN.sub(r'\1', text[start:end + 1])
+    try:
+        return json.loads(candidate)
+    except json.JSONDecodeError as e:
+        raise ValueError(f'invalid JSON: {e}')
+
+
+def validate_itinerary(data):
+    """Return a list of schema problems with a compact itinerary (empty if valid)"""
+    if not isinstance(data, dict):
+        return ['itinerary must be an object']
+    errors = []
+    cities = data.get('cities')
+    segments = data.get('segments')
+    if not isinstance(cities, list) or len(cities) < 2:
+        errors.append('cities must be a list of at least 2 [name, lat, lng] entries')
+        cities = []
+    for i, city in enumerate(cities):
+        if (not isinstance(city, list) or len(city) != 3 or not isinstance(city[0], str)
+                or not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in city[1:])):
+            errors.append(f'cities[{i}] must be [name, lat, lng]')
+        elif not (-90 <= city[1] <= 90 and -180 <= city[2] <= 180):
+            errors.append(f'cities[{i}] coordinates out of range')
+    if not isinstance(segments, list):
+        errors.append('segments must be a list of transport mode lists')
+        segments = []
+    elif cities and len(segments) != len(cities) - 1:
+        errors.append(f'segments must have {len(cities) - 1} entries, one per leg')
+    for i, modes in enumerate(segments):
+        if not isinstance(modes, list) or not modes:
+            errors.append(f'segments[{i}] must be a non-empty list of modes')
+        elif any(mode not in TRANSPORT_MODES for mode in modes):
+            errors.append(f'segments[{i}] modes must be among {", ".join(TRANSPORT_MODES)}')
+    extra = set(data) - {'cities', 'segments'}
+    if extra:
+        errors.append(f'unexpected keys: {", ".join(sorted(extra))}')
+    return errors
+
+
+def validate_reply(data):
+    """Return a list of schema problems with a full json_schema-mode reply"""
+    if not isinstance(data, dict):
+        return ['reply must be an object']
+    errors = []
+    if not isinstance(data.get('message'), str):
+        errors.append('message must be a string')
+    if data.get('itinerary') is not None:
+        errors.extend(validate_itinerary(data['itinerary']))
+    return errors
+
+
+def completion_text(completion_message):
+    """Text content of a Llama completion_message, or '' when it has none"""
+    if not isinstance(completion_message, dict):
+        return ''
+    content = completion_message.get('content') or {}
+    text = content.get('text', '') if isinstance(content, dict) else content
+    return text if isinstance(text, str) else ''
+
+
+def parse_reply(completion_message, mode):
+    """
+    Split a Llama completion_message into message text and compact itinerary.
+
+    Returns a dict with message, itinerary, errors, and the raw text plus
+    schema a repair pass should target when errors is non-empty.
+    """
+    text = completion_text(completion_message)
+
+    if mode == 'tool':
+        parsed = {'message': text.strip(), 'itinerary': None, 'errors': [],
+                  'raw': None, 'schema': ITINERARY_SCHEMA}
+        for call in completion_message.get('tool_calls') or []:
+            function = call.get('function', {})
+            if function.get('name') == TOOL_NAME:
+                parsed['raw'] = function.get('arguments', '')
+                break
+        if parsed['raw'] is not None:
+            _load_itinerary(parsed, parsed['raw'])
+        return parsed
+
+    parsed = {'message': None, 'itinerary': None, 'errors': [], 'raw': text, 'schema': REPLY_SCHEMA}
+    _load_reply(parsed, text)
+    return parsed
+
+
+def apply_repair(parsed, repaired_text):
+    """Re-parse the output of a repair call into `parsed`, returning True if now valid"""
+    parsed['errors'] = []
+    if parsed['schema'] is ITINERARY_SCHEMA:
+        _load_itinerary(parsed, repaired_text)
+    else:
+        _load_reply(parsed, repaired_text)
+    ITINERARY_REPAIRS.inc(result='fixed' if not parsed['errors'] else 'failed')
+    return not parsed['errors']
+
+
+def repair_messages(parsed):
+    """Messages for the single repair call on malformed output"""
+    raw = parsed['raw'] if isinstance(parsed['raw'], str) else json.dumps(parsed['raw'])
+    return [
+        {"role": "system", "content": REPAIR_PROMPT.format(
+            schema=json.dumps(parsed['schema'], separators=(',', ':')),
+            problems='; '.join(parsed['errors']))},
+        {"role": "user", "content": raw}
+    ]
+
+
+def _load_itinerary(parsed, raw):
+    try:
+        data = loads_lenient(raw)
+    except ValueError as e:
+        parsed['errors'] = [str(e)]
+        return
+    parsed['errors'] = validate_itinerary(data)
+    if not parsed['errors']:
+        parsed['itinerary'] = data
+
+
+def _load_reply(parsed, raw):
+    try:
+        data = loads_lenient(raw)
+    except ValueError as e:
+        parsed['errors'] = [str(e)]
+        return
+    if isinstance(data, dict) and isinstance(data.get('message'), str):
+        parsed['message'] = data['message'].strip()
+    parsed['errors'] = validate_reply(data)
+    if not parsed['errors']:
+        parsed['itinerary'] = data.get('itinerary')
+
+
+def expand_itinerary(compact):
+    """Convert the compact itinerary into the cities/segments shape used by app.py"""
+    cities = [{"name": name, "lat": lat, "lng": lng} for name, lat, lng in compact['cities']]
+    segments = [
+        {"from": cities[i]['name'], "to": cities[i + 1]['name'], "transport_modes": modes}
+        for i, modes in enumerate(compact['segments'])
+        if i + 1 < len(cities)
+    ]
+    return {"cities": cities, "segments": segments}
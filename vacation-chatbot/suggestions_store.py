@@ -0,0 +1,238 @@
+"""
+Suggestions Store Module
+Indexed destination knowledge base behind /api/suggestions
+
+Destinations are loaded once from a JSON data file (data/destinations.json by
+default, or SUGGESTIONS_FILE) into dictionaries keyed by normalized name and
+alias, every name prefix, and every single-character deletion of each name
+(for typo-tolerant matching). Lookups therefore take the same time whether
+the catalog holds ten destinations or ten thousand.
+
+The file is checked for changes at most every SUGGESTIONS_RELOAD_INTERVAL
+seconds and the index is rebuilt and swapped in place, so each worker picks
+up edits without a restart.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+import metrics
+from fast_path import normalize
+
+SUGGESTIONS_FILE = os.getenv(
+    'SUGGESTIONS_FILE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'destinations.json'))
+SUGGESTIONS_RELOAD_INTERVAL = float(os.getenv('SUGGESTIONS_RELOAD_INTERVAL', '5'))
+
+CATEGORIES = ['transport', 'accommodation', 'activities']
+
+# Shortest prefix that may stand in for a full name
+MIN_PREFIX_LENGTH = 3
+
+NON_ALNUM_PATTERN = re.compile(r'[^a-z0-9]+')
+
+
+def normalize_name(name):
+    """Lowercase, accent-free, single-spaced name used as an index key"""
+    return NON_ALNUM_PATTERN.sub(' ', normalize(name or '')).strip()
+
+
+def _deletes(key):
+    return {key[:i] + key[i + 1:] for i in range(len(key))}
+
+
+def _check_suggestions(suggestions, where):
+    if not isinstance(suggestions, dict):
+        raise ValueError(f'{where} must be an object')
+    for category in CATEGORIES:
+        items = suggestions.get(category, [])
+        if not isinstance(items, list):
+            raise ValueError(f'{where}.{category} must be a list')
+        for item in items:
+            if isinstance(item, str):
+                continue
+            if (not isinstance(item, dict) or not isinstance(item.get('text'), str)
+                    or not isinstance(item.get('tags', []), list)):
+                raise ValueError(f'{where}.{category} items must be strings or {{text, tags}} objects')
+
+
+def validate_data(data):
+    """Raise ValueError if a parsed data file does not have the expected shape"""
+    if not isinstance(data, dict):
+        raise ValueError('data file must be a JSON object')
+    _check_suggestions(data.get('default', {}), 'default')
+    destinations = data.get('destinations', [])
+    if not isinstance(destinations, list):
+        raise ValueError('destinations must be a list')
+    for i, entry in enumerate(destinations):
+        if not isinstance(entry, dict) or not isinstance(entry.get('name'), str):
+            raise ValueError(f'destinations[{i}] must be an object with a name')
+        aliases = entry.get('aliases', [])
+        if not isinstance(aliases, list) or not all(isinstance(alias, str) for alias in aliases):
+            raise ValueError(f'destinations[{i}].aliases must be a list of strings')
+        if entry.get('country') is not None and not isinstance(entry['country'], str):
+            raise ValueError(f'destinations[{i}].country must be a string')
+        _check_suggestions(entry, f'destinations[{i}]')
+
+
+class DestinationIndex:
+    """Immutable lookup tables built from one version of the data file"""
+
+    def __init__(self, data, version):
+        validate_data(data)
+        self.version = version
+        self.default = data.get('default', {})
+        self.destinations = data.get('destinations', [])
+        self.exact = {}
+        self.prefixes = {}
+        self.fuzzy = {}
+
+        for entry in self.destinations:
+            names = [entry['name']] + entry.get('aliases', [])
+            if entry.get('country'):
+                names.append(f"{entry['name']} {entry['country']}")
+            for name in names:
+                key = normalize_name(name)
+                if not key:
+                    continue
+                self.exact.setdefault(key, entry)
+                for length in range(MIN_PREFIX_LENGTH, len(key)):
+                    # Keep the first (highest listed) destination for a shared prefix
+                    self.prefixes.setdefault(key[:length], entry)
+                for deleted in _deletes(key):
+                    self.fuzzy.setdefault(deleted, entry)
+
+    def __len__(self):
+        return len(self.destinations)
+
+    def find(self, destination):
+        """Return (entry, match_type) for a free-form destination, or (None, 'default')"""
+        key = normalize_name(destination)
+        if not key:
+            return None, 'default'
+
+        # "Paris, France" or "Paris, TX" from trip context: try the whole name, then the city part
+        candidates = [key]
+        if ',' in destination:
+            candidates.append(normalize_name(destination.split(',')[0]))
+
+        for candidate in candidates:
+            if candidate in self.exact:
+                return self.exact[candidate], 'exact'
+        for candidate in candidates:
+            if candidate in self.prefixes:
+                return self.prefixes[candidate], 'prefix'
+        for candidate in candidates:
+            # Edit distance 1: a typo deleted, added or substituted one character
+            if candidate in self.fuzzy:
+                return self.fuzzy[candidate], 'fuzzy'
+            for deleted in _deletes(candidate):
+                if deleted in self.exact:
+                    return self.exact[deleted], 'fuzzy'
+                if deleted in self.fuzzy:
+                    return self.fuzzy[deleted], 'fuzzy'
+        return None, 'default'
+
+
+def _item_text(item):
+    return item['text'] if isinstance(item, dict) else item
+
+
+def _item_tags(item):
+    return set(item.get('tags', [])) if isinstance(item, dict) else set()
+
+
+def filter_by_preferences(suggestions, preferences):
+    """
+    Keep the suggestions tagged with any of the preferences.
+
+    Categories with no matching suggestion keep all of them, so a narrow
+    preference never leaves the user with an empty list.
+    """
+    wanted = {normalize_name(p) for p in preferences or [] if isinstance(p, str)}
+    wanted.discard('')
+    result = {}
+    for category in CATEGORIES:
+        items = suggestions.get(category, [])
+        if wanted:
+            matching = [item for item in items if _item_tags(item) & wanted]
+            items = matching or items
+        result[category] = [_item_text(item) for item in items]
+    return result
+
+
+class SuggestionsStore:
+    """Hot-reloading holder for the current DestinationIndex"""
+
+    def __init__(self, path=SUGGESTIONS_FILE, reload_interval=SUGGESTIONS_RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._index = None
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        stat = os.stat(self.path)
+        with open(self.path, 'rb') as f:
+            raw = f.read()
+        data = json.loads(raw)
+        version = hashlib.sha1(raw).hexdigest()[:16]
+        index = DestinationIndex(data, version)
+        # Swap in one assignment so concurrent readers see either the old or the new index
+        self._index = index
+        self._mtime = stat.st_mtime
+        print(f"🧭 Loaded {len(index)} destinations for suggestions (version {version})")
+
+    def index(self):
+        """Current index, reloading first if the data file changed"""
+        now = time.monotonic()
+        if now - self._checked_at >= self.reload_interval:
+            with self._lock:
+                if now - self._checked_at >= self.reload_interval:
+                    self._checked_at = now
+                    try:
+                        mtime = os.stat(self.path).st_mtime
+                        if mtime != self._mtime:
+                            try:
+                                self._load()
+                            except (ValueError, KeyError, TypeError, AttributeError):
+                                # Don't retry a broken file until it changes again
+                                self._mtime = mtime
+                                raise
+                    except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+                        # Keep serving the last good version
+                        print(f"Error reloading suggestions from {self.path}: {e}")
+        return self._index
+
+    def suggest(self, destination, preferences=None):
+        """Return (suggestions, match_type, etag) for a destination and preferences"""
+        index = self.index()
+        entry, match_type = index.find(destination)
+        metrics.record_cache_lookup('suggestions', entry is not None)
+        source = entry if entry is not None else index.default
+        suggestions = filter_by_preferences(source, preferences)
+
+        key = normalize_name(entry['name']) if entry else ''
+        prefs = ','.join(sorted(normalize_name(p) for p in preferences or [] if isinstance(p, str)))
+        etag = '"' + hashlib.sha1(f"{index.version}|{key}|{prefs}".encode('utf-8')).hexdigest()[:20] + '"'
+        return suggestions, match_type, etag
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Load the suggestions store on first use"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SuggestionsStore()
+    return _store
@@ -0,0 +1,197 @@
+"""
+Tracing Module
+Minimal OpenTelemetry-compatible request tracing with offline console/file exporters
+
+Spans are written as one JSON object per line using OpenTelemetry field names
+(trace_id, span_id, parent_span_id, start/end time in unix nanoseconds,
+attributes, status) so they can be loaded into any OTLP-aware tooling.
+
+Configure with environment variables:
+    TRACING_EXPORTER = none | console | file   (default: none)
+    TRACING_FILE     = path for the file exporter (default: traces.jsonl)
+"""
+
+import contextvars
+import functools
+import json
+import os
+import re
+import secrets
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+TRACING_EXPORTER = os.getenv('TRACING_EXPORTER', 'none').lower()
+TRACING_FILE = os.getenv('TRACING_FILE', 'traces.jsonl')
+
+SERVICE_NAME = 'ecotrip-backend'
+
+# W3C trace context header: version-traceid-spanid-flags
+TRACEPARENT_PATTERN = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$')
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+class Span:
+    """A single timed operation within a trace"""
+
+    def __init__(self, name, trace_id, parent_span_id=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent_span_id
+        self.attributes = dict(attributes or {})
+        self.status = 'UNSET'
+        self.status_message = None
+        self.start_time_unix_nano = time.time_ns()
+        self.end_time_unix_nano = None
+        self.thread = threading.current_thread().name
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_error(self, message):
+        self.status = 'ERROR'
+        self.status_message = message
+
+    def end(self):
+        self.end_time_unix_nano = time.time_ns()
+        if self.status == 'UNSET':
+            self.status = 'OK'
+
+    @property
+    def traceparent(self):
+        return f'00-{self.trace_id}-{self.span_id}-01'
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_span_id': self.parent_span_id,
+            'start_time_unix_nano': self.start_time_unix_nano,
+            'end_time_unix_nano': self.end_time_unix_nano,
+            'duration_ms': round((self.end_time_unix_nano - self.start_time_unix_nano) / 1e6, 3),
+            'attributes': self.attributes,
+            'status': {'code': self.status, 'message': self.status_message},
+            'resource': {'service.name': SERVICE_NAME, 'thread.name': self.thread}
+        }
+
+
+class ConsoleExporter:
+    """Write finished spans to stdout"""
+
+    def export(self, span):
+        print(json.dumps(span.to_dict()), file=sys.stdout, flush=True)
+
+
+class FileExporter:
+    """Append finished spans to a JSON-lines file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        line = json.dumps(span.to_dict())
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+
+def _build_exporter():
+    if TRACING_EXPORTER == 'console':
+        return ConsoleExporter()
+    if TRACING_EXPORTER == 'file':
+        return FileExporter(TRACING_FILE)
+    return None
+
+
+_exporter = _build_exporter()
+
+
+def set_exporter(exporter):
+    """Replace the active exporter (None disables tracing)"""
+    global _exporter
+    _exporter = exporter
+
+
+def is_enabled():
+    return _exporter is not None
+
+
+def current_span():
+    return _current_span.get()
+
+
+def parse_traceparent(header):
+    """Return (trace_id, parent_span_id) from a W3C traceparent header, or None"""
+    if not header:
+        return None
+    match = TRACEPARENT_PATTERN.match(header.strip().lower())
+    if not match:
+        return None
+    return match.group(1), match.group(2)
+
+
+@contextmanager
+def start_span(name, attributes=None, traceparent=None):
+    """Start a span as a child of the current one (or a new root span)"""
+    if _exporter is None:
+        yield None
+        return
+
+    parent = _current_span.get()
+    if parent is not None:
+        trace_id, parent_span_id = parent.trace_id, parent.span_id
+    else:
+        remote = parse_traceparent(traceparent)
+        if remote:
+            trace_id, parent_span_id = remote
+        else:
+            trace_id, parent_span_id = secrets.token_hex(16), None
+
+    span = Span(name, trace_id, parent_span_id, attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except Exception as e:
+        span.set_error(str(e))
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+        try:
+            _exporter.export(span)
+        except Exception as e:
+            print(f"Error exporting span {name}: {e}")
+
+
+def traced(name=None):
+    """Decorator wrapping a function call in a span"""
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _exporter is None:
+                return func(*args, **kwargs)
+            with start_span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def set_attribute(key, value):
+    """Set an attribute on the current span, if any"""
+    span = _current_span.get()
+    if span is not None:
+        span.set_attribute(key, value)
+
+
+def set_error(message):
+    """Mark the current span as failed, if any"""
+    span = _current_span.get()
+    if span is not None:
+        span.set_error(message)